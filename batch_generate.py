@@ -0,0 +1,210 @@
+# batch_generate.py
+
+"""
+Generación por lotes, sin interfaz, de estudios completos para una lista de obras.
+Cada estudio se genera en un proceso del pool y, dentro de él, sus secciones se generan
+en paralelo con un pool de hilos. Por cada obra se escriben un .md y un .docx en el
+directorio de salida y al final se muestra un resumen del rendimiento.
+
+    OPENROUTER_API_KEY=... python batch_generate.py --output-dir estudios --processes 4
+
+Sin --works se usan las obras de predefined_lists.PREDEFINED_WORKS. El archivo de --works
+tiene una obra por línea, con el autor opcional separado por "|" (por ejemplo "Hamlet | William Shakespeare").
+Cada sección se guarda en study_store en cuanto termina, de modo que una ejecución interrumpida
+se retoma desde las secciones pendientes (--fresh empieza de nuevo).
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_OUTPUT_DIR = "estudios"
+DEFAULT_PROCESSES = min(4, os.cpu_count() or 1)
+DEFAULT_SECTION_WORKERS = 4
+DEFAULT_TOTAL_SECTIONS = 10
+
+def load_works(path=None):
+    """
+    Retorna la lista de pares (título, autor). Sin archivo se usan las obras predefinidas
+    con el autor que indica el catálogo.
+    """
+    from catalogue import default_catalogue
+    catalogue = default_catalogue()
+    if path is None:
+        from predefined_lists import PREDEFINED_WORKS
+        lines = PREDEFINED_WORKS
+    else:
+        with open(path, encoding="utf-8") as works_file:
+            lines = [line.strip() for line in works_file if line.strip() and not line.lstrip().startswith("#")]
+    works = []
+    seen = set()
+    for line in lines:
+        title, _, author = line.partition("|")
+        title, author = title.strip(), author.strip()
+        entry = catalogue.lookup(title)
+        if entry:
+            title, author = entry['title'], author or entry['author']
+        if title.lower() not in seen:
+            seen.add(title.lower())
+            works.append((title, author))
+    return works
+
+def study_file_stem(work_title):
+    from catalogue import normalize_text
+    return normalize_text(work_title).replace(" ", "_") or "estudio"
+
+def _init_worker(requests_per_minute, tokens_per_minute, hedge=False):
+    # Cada proceso recibe una parte de la cuota del proveedor para que el total no la supere
+    import hedging
+    import rate_limiter
+    rate_limiter.configure(requests_per_minute, tokens_per_minute)
+    if hedge:
+        hedging.ENABLED = True
+
+def _lookup_work_type(work_title, author):
+    from open_library import extract_work_info, search_open_library
+    work = search_open_library(work_title, author)
+    return extract_work_info(work)['work_type'] if work else "Otro"
+
+def batch_study_id(work_title):
+    # Identificador estable por obra, para retomar el mismo estudio en la siguiente ejecución
+    return "batch-" + study_file_stem(work_title)
+
+def generate_study(work_title, author, work_type, total_sections, section_workers, output_dir, resume=True, parts=False):
+    """
+    Genera un estudio completo (título, descripción, tabla de contenidos y secciones) y lo
+    escribe en output_dir. Con resume=True continúa el estudio guardado de una ejecución anterior.
+    Con parts=True las secciones se redactan por apartados en paralelo.
+    Se ejecuta en un proceso del pool; retorna un diccionario con el resultado.
+    """
+    import instrumentation
+    import study_store
+    from content_generation import bootstrap_study, generate_pending_sections
+    from study_document import StudyDocument
+    from utils import export_to_word
+
+    start = time.perf_counter()
+    result = {"work": work_title, "ok": False, "sections": 0, "resumed_sections": 0, "failed_sections": [], "characters": 0, "seconds": 0.0, "error": None}
+    study_id = batch_study_id(work_title)
+    # Las llamadas del estudio quedan asociadas a su identificador en las trazas
+    with instrumentation.study(study_id):
+        try:
+            document, info = study_store.load_study(study_id) if resume else (None, None)
+            if document is not None and document.sections:
+                work_type = work_type or info['work_type']
+                result["resumed_sections"] = len(document.generated_sections())
+            else:
+                work_type = work_type or _lookup_work_type(work_title, author)
+                # Título, descripción y tabla de contenidos a la vez; el tipo de obra ya se buscó en Open Library
+                bootstrap = bootstrap_study(work_title, author, work_type, total_sections, lookup=False)
+                title, description, table_of_contents = bootstrap['title'], bootstrap['description'], bootstrap['table_of_contents']
+                if not (title and description):
+                    result["error"] = "No se pudo generar el título y la descripción."
+                    return result
+                if not table_of_contents:
+                    result["error"] = "No se pudo generar la tabla de contenidos."
+                    return result
+                document = StudyDocument(title, description, table_of_contents)
+                study_store.save_study(study_id, document, work_title, author, work_type)
+            result["work_type"] = work_type
+            result["failed_sections"] = generate_pending_sections(
+                document, work_title, author, work_type, section_workers, session_id=f"batch:{work_title}", parts=parts,
+                on_section_done=lambda sec_num: study_store.save_section(study_id, document.get_section(sec_num))
+            )
+            result["sections"] = len(document.generated_sections())
+
+            os.makedirs(output_dir, exist_ok=True)
+            stem = os.path.join(output_dir, study_file_stem(work_title))
+            markdown_content = document.to_markdown(partial=not document.is_complete())
+            with open(stem + ".md", "w", encoding="utf-8") as markdown_file:
+                markdown_file.write(markdown_content)
+            # Las referencias las agrega export_to_word al final del documento
+            docx_content = document.to_markdown(partial=not document.is_complete(), include_references=False)
+            with open(stem + ".docx", "wb") as docx_file:
+                docx_file.write(export_to_word(docx_content, document.references).getvalue())
+            result["characters"] = len(markdown_content)
+            result["ok"] = document.is_complete()
+        except Exception as e:
+            result["error"] = str(e)
+        finally:
+            result["seconds"] = time.perf_counter() - start
+        return result
+
+def run_batch(works, output_dir, processes, section_workers, total_sections, work_type=None, resume=True, on_result=None, hedge=False, parts=False):
+    """
+    Reparte los estudios entre un pool de procesos. Retorna la lista de resultados.
+    """
+    import rate_limiter
+    processes = max(1, min(processes, len(works)))
+    initargs = (
+        max(1, rate_limiter.REQUESTS_PER_MINUTE // processes),
+        max(1, rate_limiter.TOKENS_PER_MINUTE // processes),
+        hedge
+    )
+    results = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=initargs) as executor:
+        futures = [
+            executor.submit(generate_study, title, author, work_type, total_sections, section_workers, output_dir, resume, parts)
+            for title, author in works
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+    return results
+
+def format_summary(results, elapsed):
+    completed = [result for result in results if result["ok"]]
+    sections = sum(result["sections"] - result["resumed_sections"] for result in results)
+    characters = sum(result["characters"] for result in results)
+    minutes = max(elapsed, 1e-9) / 60
+    lines = [
+        f"Estudios completos: {len(completed)}/{len(results)} en {elapsed:.1f} s",
+        f"Secciones generadas: {sections} ({sections / minutes:.1f} por minuto)",
+        f"Estudios por hora: {len(completed) / minutes * 60:.1f}",
+        f"Caracteres escritos: {characters} ({characters / max(elapsed, 1e-9):.0f} por segundo)",
+    ]
+    if completed:
+        durations = sorted(result["seconds"] for result in completed)
+        lines.append(f"Tiempo por estudio: mediana {durations[len(durations) // 2]:.1f} s, máximo {durations[-1]:.1f} s")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera estudios completos para una lista de obras, sin interfaz.")
+    parser.add_argument("--works", help="Archivo con una obra por línea ('Título | Autor'); por defecto las obras predefinidas")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES, help="Estudios generados a la vez")
+    parser.add_argument("--section-workers", type=int, default=DEFAULT_SECTION_WORKERS, help="Secciones en paralelo por estudio")
+    parser.add_argument("--sections", type=int, default=DEFAULT_TOTAL_SECTIONS, help="Secciones por estudio")
+    parser.add_argument("--work-type", choices=["Literaria", "Filosófica", "Política", "Otro"],
+                        help="Tipo de obra para todas; por defecto se deduce de Open Library")
+    parser.add_argument("--limit", type=int, help="Generar solo las primeras N obras")
+    parser.add_argument("--fresh", action="store_true", help="No retomar estudios guardados de ejecuciones anteriores")
+    parser.add_argument("--hedge", action="store_true", help="Duplicar las secciones que tarden en empezar a responder")
+    parser.add_argument("--parts", action="store_true", help="Redactar cada sección por apartados en paralelo")
+    args = parser.parse_args(argv)
+
+    works = load_works(args.works)
+    if args.limit:
+        works = works[:args.limit]
+    if not works:
+        print("No hay obras para generar.")
+        return 1
+
+    def report(result):
+        status = "ok" if result["ok"] else f"incompleto ({result['error'] or 'secciones ' + ', '.join(map(str, result['failed_sections']))})"
+        resumed = f" ({result['resumed_sections']} retomadas)" if result["resumed_sections"] else ""
+        print(f"[{result['seconds']:6.1f} s] {result['work']}: {result['sections']} secciones{resumed}, {status}", flush=True)
+
+    start = time.perf_counter()
+    results = run_batch(works, args.output_dir, args.processes, args.section_workers, args.sections, args.work_type,
+                        resume=not args.fresh, on_result=report, hedge=args.hedge, parts=args.parts)
+    print()
+    print(format_summary(results, time.perf_counter() - start))
+    return 0 if all(result["ok"] for result in results) else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# benchmarks/bench_catalogue.py
+
+"""
+Mide el tiempo por consulta de Catalogue.suggest sobre un catálogo sintético grande
+(las obras predefinidas más títulos generados al azar), como ocurriría en cada pulsación.
+
+    python benchmarks/bench_catalogue.py --size 50000
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalogue import Catalogue
+from predefined_lists import PREDEFINED_CATALOGUE
+
+QUERIES = [
+    "h", "ham", "hamlet", "el se", "el señor de los anilos", "don quijte de la",
+    "la ciudad y", "memoria del mar", "xqz", "cien anos de soledad", "rebelion en la gr", "shakes",
+]
+
+def build_catalogue(size, seed=1):
+    rng = random.Random(seed)
+    words = [
+        "amor", "guerra", "paz", "noche", "sombra", "ciudad", "río", "mar", "tiempo", "historia",
+        "vida", "muerte", "casa", "jardín", "memoria", "silencio", "viaje", "sueño", "luz", "tierra",
+    ] + ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(3000)]
+    catalogue = Catalogue(PREDEFINED_CATALOGUE)
+    while len(catalogue) < size:
+        title = " ".join([rng.choice(["El", "La", "Los", "Las", ""])] + rng.choices(words, k=rng.randint(1, 4))).strip()
+        catalogue.add(title, "Autor " + rng.choice(words))
+    return catalogue
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las sugerencias del catálogo.")
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    catalogue = build_catalogue(args.size)
+    print(f"Catálogo de {len(catalogue)} obras construido en {time.perf_counter() - start:.2f} s")
+    print(f"{'consulta':<28}{'ms/consulta':>12}  primera sugerencia")
+    worst = 0.0
+    for query in QUERIES:
+        catalogue.suggest(query)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            suggestions = catalogue.suggest(query)
+        elapsed_ms = (time.perf_counter() - start) / args.repeat * 1000
+        worst = max(worst, elapsed_ms)
+        first = suggestions[0]['title'] if suggestions else "-"
+        print(f"{query:<28}{elapsed_ms:>12.3f}  {first}")
+    print(f"Peor caso: {worst:.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/bench_export.py
+
+"""
+Compara el exportador a Word actual (tokens de Markdown -> python-docx) con el anterior
+(Markdown -> HTML -> BeautifulSoup -> python-docx) sobre un estudio grande de varias secciones.
+Mide el tiempo (mejor de varias repeticiones) y la memoria máxima con tracemalloc.
+
+El exportador anterior necesita los paquetes markdown y beautifulsoup4:
+
+    pip install markdown beautifulsoup4
+    python benchmarks/bench_export.py --sections 50
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import export_to_word
+
+def legacy_export_to_word(markdown_content, references):
+    """
+    Copia del exportador anterior, conservada solo como referencia para la comparación.
+    """
+    import markdown
+    from bs4 import BeautifulSoup
+    from docx import Document
+
+    html = markdown.markdown(markdown_content)
+    soup = BeautifulSoup(html, 'html.parser')
+    doc = Document()
+    for element in soup.descendants:
+        if isinstance(element, str):
+            continue
+        if element.name == 'h1':
+            doc.add_heading(element.get_text(), level=1)
+        elif element.name == 'h2':
+            doc.add_heading(element.get_text(), level=2)
+        elif element.name == 'h3':
+            doc.add_heading(element.get_text(), level=3)
+        elif element.name == 'p':
+            doc.add_paragraph(element.get_text())
+    if references:
+        doc.add_heading("Referencias", level=2)
+        for ref in references:
+            doc.add_paragraph(ref, style='List Number')
+    buffer = BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+def build_study(sections, paragraphs_per_section=25):
+    """
+    Genera un estudio sintético con una estructura parecida a la de las secciones del modelo.
+    """
+    paragraph = (
+        "El análisis de **la obra** muestra cómo el autor construye a sus *personajes* a partir "
+        "de tensiones morales y sociales propias de su época, con una técnica narrativa que "
+        "alterna la voz del narrador y el diálogo. "
+    ) * 3
+    parts = ["# Estudio de prueba\n\nDescripción del estudio.\n\n## Tabla de Contenidos\n\n"]
+    parts.extend(f"{num}. Sección {num}\n" for num in range(1, sections + 1))
+    parts.append("\n")
+    for num in range(1, sections + 1):
+        parts.append(f"## Sección {num}: Título {num}\n\n")
+        for idx in range(paragraphs_per_section):
+            if idx % 8 == 0:
+                parts.append(f"### Apartado {idx // 8 + 1}\n\n")
+            parts.append(paragraph + "\n\n")
+        parts.append("- Primer punto clave\n- Segundo punto clave\n- Tercer punto clave\n\n")
+        parts.append("> Una cita relevante de la obra.\n\n")
+    references = [f"Autor, A. ({1900 + num}). Título del libro {num}. Editorial." for num in range(sections * 3)]
+    return "".join(parts), references
+
+def measure(func, markdown_content, references, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(markdown_content, references)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(markdown_content, references)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la exportación a Word.")
+    parser.add_argument("--sections", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    markdown_content, references = build_study(args.sections)
+    print(f"Estudio de {args.sections} secciones, {len(markdown_content) / 1024:.0f} KiB de Markdown")
+    print(f"{'exportador':<12}{'tiempo (s)':>12}{'memoria máx. (MiB)':>22}")
+    for name, func in (("anterior", legacy_export_to_word), ("actual", export_to_word)):
+        seconds, peak = measure(func, markdown_content, references, args.repeat)
+        print(f"{name:<12}{seconds:>12.3f}{peak / (1024 * 1024):>22.1f}")
+
+if __name__ == "__main__":
+    main()
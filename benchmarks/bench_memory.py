@@ -0,0 +1,100 @@
+# benchmarks/bench_memory.py
+
+"""
+Mide la memoria que ocupa cada sesión de Streamlit con un estudio abierto. Guarda un estudio
+sintético en un almacén temporal y simula varias sesiones que lo abren (como al cargar la
+página con ?study=), lo muestran en Markdown y lo conservan en su estado. Con tracemalloc
+separa la memoria propia de cada sesión de la caché de textos compartida de content_store,
+cuyo tamaño está acotado por MEMORY_CACHE_MAX_BYTES para todo el proceso.
+
+    python benchmarks/bench_memory.py --sections 50 --sessions 20 --max-session-kb 128
+
+Con el umbral, el programa termina con código 1 si una sesión ocupa más de lo indicado.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = (
+    "la obra presenta una estructura narrativa compleja donde el autor explora el contexto histórico "
+    "los personajes principales y las tensiones sociales de su tiempo con una prosa rica en matices"
+).split()
+
+def build_sections(sections, words, seed=1):
+    rng = random.Random(seed)
+    return [
+        {
+            "number": number,
+            "title": f"Sección {number}: {' '.join(rng.choice(WORDS) for _ in range(5))}",
+            "content": " ".join(rng.choice(WORDS) for _ in range(words)),
+            "references": [f"Autor{number}{idx}, A. ({1950 + idx}). Título {number}-{idx}. Editorial Académica." for idx in range(5)]
+        }
+        for number in range(1, sections + 1)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria por sesión con un estudio abierto.")
+    parser.add_argument("--sections", type=int, default=50)
+    parser.add_argument("--section-words", type=int, default=2200, help="Palabras por sección (~3000 tokens)")
+    parser.add_argument("--sessions", type=int, default=20, help="Sesiones simuladas que abren el estudio")
+    parser.add_argument("--json", help="Archivo donde escribir los resultados")
+    parser.add_argument("--max-session-kb", type=float, help="Umbral de memoria propia por sesión")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        import content_store
+        import study_store
+        from study_document import StudyDocument
+        content_store.STORE_PATH = os.path.join(workdir, "contents.sqlite3")
+        study_store.STORE_PATH = os.path.join(workdir, "studies.sqlite3")
+
+        sections = build_sections(args.sections, args.section_words)
+        text_bytes = sum(sys.getsizeof(sec['content']) for sec in sections)
+        study_store.save_study("bench", StudyDocument("Estudio", "Descripción", sections), "Obra", "Autor", "Literaria")
+        del sections
+        gc.collect()
+
+        tracemalloc.start()
+        gc.collect()
+        base = tracemalloc.get_traced_memory()[0]
+        cache_before = content_store.get_stats()["memory_bytes"]
+        sessions = []
+        for _ in range(args.sessions):
+            document, info = study_store.load_study("bench")
+            document.to_markdown()
+            sessions.append({"document": document, "study_id": "bench", **info})
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - base
+        tracemalloc.stop()
+        cache_bytes = content_store.get_stats()["memory_bytes"]
+
+    shared = max(0, cache_bytes - cache_before)
+    per_session = max(0, used - shared) / args.sessions
+    results = {
+        "sections": args.sections,
+        "sessions": args.sessions,
+        "section_text_kb": text_bytes / 1024,
+        "per_session_kb": per_session / 1024,
+        "shared_cache_kb": cache_bytes / 1024,
+        "shared_cache_max_kb": content_store.MEMORY_CACHE_MAX_BYTES / 1024,
+    }
+    print(f"Estudio de {args.sections} secciones: {results['section_text_kb']:.0f} KiB de texto")
+    print(f"Memoria propia por sesión: {results['per_session_kb']:.1f} KiB ({args.sessions} sesiones)")
+    print(f"Caché compartida de textos: {results['shared_cache_kb']:.0f} KiB (máximo {results['shared_cache_max_kb']:.0f} KiB para todo el proceso)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2, ensure_ascii=False)
+    if args.max_session_kb is not None and results["per_session_kb"] > args.max_session_kb:
+        print(f"Se superó el umbral de {args.max_session_kb:.0f} KiB por sesión")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
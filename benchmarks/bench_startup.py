@@ -0,0 +1,135 @@
+# benchmarks/bench_startup.py
+
+"""
+Mide el arranque de la aplicación y la ejecución del script por sesión:
+
+- Arranque en frío: ejecuta main.py en un proceso nuevo con `python -X importtime` y suma
+  el tiempo de importación de cada módulo de primer nivel. Comprueba además que las
+  dependencias pesadas que se cargan bajo demanda (exportación a Word, cliente HTTP) no se
+  importen al arrancar.
+- Script por sesión: con streamlit.testing ejecuta main.py como lo haría una sesión nueva
+  (primera ejecución) y mide las reejecuciones siguientes.
+
+    python benchmarks/bench_startup.py --json startup.json --max-import-ms 800 --max-rerun-ms 150
+
+Con los umbrales, el programa termina con código 1 si alguno se supera, para usarlo como control de regresiones.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LAZY_MODULES = ("docx", "markdown_it", "lxml", "requests", "content_generation", "utils")  # No deben cargarse al arrancar
+APP_MODULES = ("catalogue", "completion_cache", "content_store", "job_runner", "rate_limiter", "references", "study_document", "study_store")
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+def parse_importtime(stderr):
+    """
+    Retorna {módulo de primer nivel: microsegundos acumulados} a partir de la salida de -X importtime.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match and not match.group(3):
+            modules[match.group(4)] = modules.get(match.group(4), 0) + int(match.group(2))
+    return modules
+
+def measure_cold_start(repeat):
+    """
+    Ejecuta main.py en procesos nuevos. Retorna el mejor tiempo total, el tiempo de
+    importación y el desglose por módulo de esa ejecución.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import runpy; runpy.run_path('main.py')"],
+            cwd=ROOT, capture_output=True, text=True
+        )
+        wall_ms = (time.perf_counter() - start) * 1000
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr[-2000:])
+        modules = parse_importtime(completed.stderr)
+        import_ms = sum(modules.values()) / 1000
+        if best is None or import_ms < best["import_ms"]:
+            best = {"wall_ms": wall_ms, "import_ms": import_ms, "modules": modules}
+    return best
+
+def measure_script_runs(reruns):
+    """
+    Tiempo de la primera ejecución del script en una sesión nueva y de las reejecuciones.
+    """
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=60)
+    start = time.perf_counter()
+    app.run()
+    first_ms = (time.perf_counter() - start) * 1000
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"first_run_ms": first_ms, "rerun_ms_median": statistics.median(timings), "rerun_ms_max": max(timings)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del arranque y de la ejecución del script de main.py.")
+    parser.add_argument("--repeat", type=int, default=3, help="Procesos nuevos para el arranque en frío (se toma el mejor)")
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--top", type=int, default=10, help="Módulos más lentos que se muestran")
+    parser.add_argument("--json", help="Archivo donde escribir los resultados")
+    parser.add_argument("--max-import-ms", type=float, help="Umbral del tiempo de importación en frío")
+    parser.add_argument("--max-rerun-ms", type=float, help="Umbral de la mediana de las reejecuciones")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    cold = measure_cold_start(args.repeat)
+    runs = measure_script_runs(args.reruns)
+    eager_lazy = sorted(name for name in LAZY_MODULES if name in cold["modules"])
+
+    print(f"Arranque en frío: {cold['wall_ms']:.0f} ms de proceso, {cold['import_ms']:.0f} ms de importaciones")
+    for name, micros in sorted(cold["modules"].items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<30} {micros / 1000:8.1f} ms")
+    app_ms = sum(cold["modules"].get(name, 0) for name in APP_MODULES) / 1000
+    print(f"  (módulos de la aplicación: {app_ms:.1f} ms)")
+    print(f"Primera ejecución del script: {runs['first_run_ms']:.0f} ms")
+    print(f"Reejecuciones: mediana {runs['rerun_ms_median']:.1f} ms, máximo {runs['rerun_ms_max']:.1f} ms")
+    if eager_lazy:
+        print("Módulos que deberían cargarse bajo demanda y se importaron al arrancar: " + ", ".join(eager_lazy))
+
+    results = {
+        "python": sys.version.split()[0],
+        "cold_start_wall_ms": round(cold["wall_ms"], 1),
+        "cold_start_import_ms": round(cold["import_ms"], 1),
+        "app_modules_import_ms": round(app_ms, 1),
+        "modules_ms": {name: round(micros / 1000, 2) for name, micros in cold["modules"].items()},
+        "eager_lazy_modules": eager_lazy,
+        **{key: round(value, 1) for key, value in runs.items()},
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2, ensure_ascii=False)
+
+    failures = []
+    if eager_lazy:
+        failures.append("dependencias pesadas importadas al arrancar")
+    if args.max_import_ms is not None and cold["import_ms"] > args.max_import_ms:
+        failures.append(f"importaciones {cold['import_ms']:.0f} ms > {args.max_import_ms:.0f} ms")
+    if args.max_rerun_ms is not None and runs["rerun_ms_median"] > args.max_rerun_ms:
+        failures.append(f"reejecución {runs['rerun_ms_median']:.1f} ms > {args.max_rerun_ms:.0f} ms")
+    if failures:
+        print("Regresión: " + "; ".join(failures))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
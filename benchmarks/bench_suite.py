@@ -0,0 +1,196 @@
+# benchmarks/bench_suite.py
+
+"""
+Benchmark reproducible de la aplicación contra el servidor simulado de mock_services
+(sin gastar en la API). Para estudios de 10, 50 y 200 secciones mide:
+
+- la generación completa del estudio (búsqueda en Open Library, título y tabla de contenidos
+  a la vez, y después las secciones en paralelo),
+- la regeneración de una sección (estructurada, por apartados en paralelo y en streaming),
+- export_to_word del estudio completo,
+- la extracción de referencias de todas las secciones,
+
+además de una búsqueda en Open Library. Los resultados (con la configuración, el resumen
+de instrumentation y los contadores del servidor) se escriben en un archivo JSON para
+comparar ejecuciones.
+
+    python benchmarks/bench_suite.py --sizes 10 50 200 --ttft 0.05 --tokens-per-second 5000 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_services import MockConfig, MockServices
+
+WORK = ("Don Quijote de la Mancha", "Miguel de Cervantes", "Literaria")
+
+def configure_app(services, workdir):
+    """
+    Apunta la aplicación al servidor simulado, con cachés y trazas en un directorio temporal
+    y cuotas que no limiten la medición.
+    """
+    os.environ["OPENROUTER_API_KEY"] = "benchmark"
+    import completion_cache
+    import content_generation
+    import content_store
+    import instrumentation
+    import open_library
+    import rate_limiter
+    content_generation.OPENROUTER_URL = services.openrouter_url
+    open_library.OPEN_LIBRARY_SEARCH_URL = services.open_library_url
+    open_library.LOOKUP_CACHE_PATH = os.path.join(workdir, "open_library.sqlite3")
+    completion_cache.CACHE_PATH = os.path.join(workdir, "completions.sqlite3")
+    content_store.STORE_PATH = os.path.join(workdir, "contents.sqlite3")
+    instrumentation.TRACE_PATH = os.path.join(workdir, "trace.jsonl")
+    rate_limiter.configure(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9)
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def run_size(sections, workers, repeat):
+    from content_generation import (
+        bootstrap_study, generate_pending_sections, generate_section_drafted, generate_section_stream,
+        generate_section_structured,
+    )
+    from references import extract_references
+    from study_document import StudyDocument
+    from utils import export_to_word
+
+    work_title, author, work_type = WORK
+    result = {"sections": sections, "workers": workers}
+
+    # Generación completa; la caché de respuestas se salta para medir siempre contra el servidor
+    def generate_study():
+        bootstrap = bootstrap_study(work_title, author, work_type, sections)
+        document = StudyDocument(bootstrap['title'], bootstrap['description'], bootstrap['table_of_contents'])
+        failed = generate_pending_sections(document, work_title, author, work_type, workers)
+        return document, failed
+
+    import completion_cache
+    cache_path = completion_cache.CACHE_PATH
+    durations = []
+    for attempt in range(repeat):
+        completion_cache.CACHE_PATH = f"{cache_path}.{sections}.{attempt}"
+        (document, failed), seconds = timed(generate_study)
+        durations.append(seconds)
+    completion_cache.CACHE_PATH = cache_path
+    result["generate_study_s"] = min(durations)
+    result["generate_study_runs_s"] = durations
+    result["sections_generated"] = len(document.generated_sections())
+    result["sections_failed"] = len(failed)
+    result["sections_per_second"] = result["sections_generated"] / min(durations)
+
+    section = document.sections[len(document.sections) // 2]
+    _, result["regenerate_structured_s"] = timed(
+        generate_section_structured, work_title, author, work_type, section['number'], section['title'], use_cache=False
+    )
+
+    # Misma sección en el modo por apartados (apartados en paralelo y una pasada corta de enlace)
+    _, result["regenerate_parts_s"] = timed(
+        generate_section_drafted, work_title, author, work_type, section['number'], section['title'], use_cache=False
+    )
+
+    def regenerate_stream():
+        first_chunk_at = None
+        start = time.perf_counter()
+        for _ in generate_section_stream(work_title, author, work_type, section['number'], use_cache=False):
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter() - start
+        return first_chunk_at
+    result["regenerate_stream_ttft_s"], result["regenerate_stream_s"] = timed(regenerate_stream)
+
+    markdown_content = document.to_markdown(include_references=False)
+    result["markdown_chars"] = len(markdown_content)
+    export_times = []
+    for _ in range(repeat):
+        buffer, seconds = timed(export_to_word, markdown_content, document.references)
+        export_times.append(seconds)
+    result["export_to_word_s"] = min(export_times)
+    result["docx_bytes"] = len(buffer.getvalue())
+
+    # Extracción de referencias sobre el texto de cada sección con su apartado de referencias
+    section_texts = [
+        document.section_content(sec['number']) + "\n\n## Referencias\n\n" + "\n".join(f"- {ref}" for ref in sec['references'])
+        for sec in document.sections
+    ]
+    extract_times = []
+    for _ in range(repeat):
+        references, seconds = timed(lambda: [ref for text in section_texts for ref in extract_references(text)])
+        extract_times.append(seconds)
+    result["extract_references_s"] = min(extract_times)
+    result["references_extracted"] = len(references)
+    result["references_unique"] = len(document.references)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la aplicación contra servicios simulados.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200], help="Secciones por estudio")
+    parser.add_argument("--workers", type=int, default=8, help="Secciones generadas en paralelo")
+    parser.add_argument("--repeat", type=int, default=1, help="Repeticiones por medida (se toma la mejor)")
+    parser.add_argument("--ttft", type=float, default=0.05, help="Segundos hasta el primer token del servidor simulado")
+    parser.add_argument("--tokens-per-second", type=float, default=5000.0)
+    parser.add_argument("--section-tokens", type=int, default=3000)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de respuestas 429/503")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Probabilidad de una réplica lenta")
+    parser.add_argument("--slow-ttft", type=float, default=2.0, help="Segundos hasta el primer token de una réplica lenta")
+    parser.add_argument("--hedge", action="store_true", help="Duplicar las peticiones de sección que tarden en empezar")
+    parser.add_argument("--output", default="bench_results.json", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    config = MockConfig(args.ttft, args.tokens_per_second, args.section_tokens, args.error_rate, args.seed,
+                        args.slow_rate, args.slow_ttft)
+    with tempfile.TemporaryDirectory() as workdir, MockServices(config) as services:
+        configure_app(services, workdir)
+        import hedging
+        import instrumentation
+        hedging.ENABLED = args.hedge
+        from open_library import search_open_library
+
+        _, lookup_seconds = timed(search_open_library, WORK[0], WORK[1], use_cache=False)
+        results = []
+        for sections in args.sizes:
+            result = run_size(sections, args.workers, args.repeat)
+            results.append(result)
+            print(
+                f"{sections:4d} secciones: estudio {result['generate_study_s']:.2f} s "
+                f"({result['sections_per_second']:.1f} secc./s, {result['sections_failed']} fallidas), "
+                f"regenerar {result['regenerate_structured_s']:.2f} s (por apartados {result['regenerate_parts_s']:.2f} s), "
+                f"exportar {result['export_to_word_s']:.3f} s, referencias {result['extract_references_s'] * 1000:.1f} ms",
+                flush=True
+            )
+        events = instrumentation.recent_events()
+
+    openrouter_latencies = [event["wall_ms"] for event in events if event["service"] == "openrouter" and event.get("cache") != "hit"]
+    output = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "open_library_lookup_s": lookup_seconds,
+        "results": results,
+        "calls": instrumentation.summarize(events),
+        "openrouter_latency_ms_median": statistics.median(openrouter_latencies) if openrouter_latencies else None,
+        "mock_requests": config.requests,
+        "mock_errors": config.errors,
+        "mock_slow_requests": config.slow_requests,
+        "hedging": hedging.default_policy.get_stats(),
+    }
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(output, output_file, indent=2, ensure_ascii=False)
+    print(f"Resultados en {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/check_streaming.py
+
+"""
+Comprobaciones de regresión de las respuestas en streaming contra el servidor simulado de
+mock_services (sin gastar en la API). Cada comprobación imprime su resultado y el programa
+termina con código 1 si alguna falla.
+
+    python benchmarks/check_streaming.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_suite import WORK, configure_app
+from mock_services import MockConfig, MockServices
+
+def check_utf8_without_charset(services):
+    """
+    El servidor simulado responde text/event-stream sin charset: el texto en streaming debe
+    coincidir con el de la llamada no streaming, con los acentos intactos.
+    """
+    from content_generation import build_section_messages, call_openrouter_api, call_openrouter_api_stream
+    messages = build_section_messages(*WORK, 1)
+    streamed = "".join(call_openrouter_api_stream(messages, use_cache=False, step="section", hedge=False)).strip()
+    complete = call_openrouter_api(messages, use_cache=False, step="section", hedge=False)
+    assert "ó" in complete, "la respuesta simulada debería contener acentos"
+    assert "Ã" not in streamed, "el streaming decodificó la respuesta como ISO-8859-1"
+    assert streamed == complete, "el texto en streaming no coincide con el de la llamada no streaming"
+
+def check_hedge_loser_finishes_after_cancel(services):
+    """
+    En una carrera con duplicado, la petición perdedora termina (y avisa) después de
+    cancelarse mientras la ganadora sigue enviando texto: la respuesta debe llegar completa.
+    """
+    import content_generation
+    import hedging
+    chunks = [f"fragmento {idx} " for idx in range(8)]
+
+    def fake_stream(messages, model, use_cache, step, attempt, response_format=None, racer=None):
+        racer.mark_sent()
+        if not racer.hedge:
+            # La original no responde hasta que la cancelan y entonces termina sin error
+            racer.cancelled.wait()
+            return
+        for chunk in chunks:
+            yield chunk
+            time.sleep(0.05)
+
+    original_stream, original_delay = content_generation._stream, hedging.DEFAULT_DELAY_SECONDS
+    content_generation._stream, hedging.DEFAULT_DELAY_SECONDS = fake_stream, 0.1
+    try:
+        policy = hedging.default_policy
+        if policy.delay("section") != 0.1:
+            raise AssertionError("la política de hedging ya tiene observaciones; se necesita un proceso limpio")
+        text = "".join(content_generation._hedged_stream([{"role": "user", "content": "prueba"}], "section", use_cache=False))
+    finally:
+        content_generation._stream, hedging.DEFAULT_DELAY_SECONDS = original_stream, original_delay
+    assert text == "".join(chunks), f"respuesta cortada: {len(text)} de {len(''.join(chunks))} caracteres"
+
+CHECKS = [check_utf8_without_charset, check_hedge_loser_finishes_after_cancel]
+
+def main():
+    failed = 0
+    with tempfile.TemporaryDirectory() as workdir, MockServices(MockConfig()) as services:
+        configure_app(services, workdir)
+        for check in CHECKS:
+            try:
+                check(services)
+            except AssertionError as e:
+                failed += 1
+                print(f"FALLO {check.__name__}: {e}")
+            else:
+                print(f"ok    {check.__name__}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
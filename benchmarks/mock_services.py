@@ -0,0 +1,253 @@
+# benchmarks/mock_services.py
+
+"""
+Servidor HTTP local que imita el endpoint de chat completions de OpenRouter (con y sin
+streaming SSE) y la búsqueda de Open Library, para medir la aplicación sin gastar en la API.
+
+La latencia se modela como un tiempo hasta el primer token más los tokens de salida a una
+velocidad fija; se pueden inyectar errores 429/503 y réplicas lentas (un tiempo hasta el
+primer token mayor) con una probabilidad dada.
+
+    python benchmarks/mock_services.py --port 8765 --ttft 0.5 --tokens-per-second 80
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = (
+    "la obra presenta una estructura narrativa compleja donde el autor explora el contexto histórico "
+    "los personajes principales y las tensiones sociales de su tiempo con una prosa rica en matices"
+).split()
+
+class MockConfig:
+    def __init__(self, ttft=0.05, tokens_per_second=5000.0, section_tokens=3000, error_rate=0.0, seed=1, slow_rate=0.0, slow_ttft=2.0):
+        self.ttft = ttft  # Segundos hasta el primer token
+        self.tokens_per_second = tokens_per_second  # Velocidad de salida
+        self.section_tokens = section_tokens  # Tokens de salida de una sección
+        self.error_rate = error_rate  # Probabilidad de responder 429 o 503
+        self.slow_rate = slow_rate  # Probabilidad de que la petición caiga en una réplica lenta
+        self.slow_ttft = slow_ttft  # Segundos hasta el primer token de una réplica lenta
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.slow_requests = 0
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            failed = self.error_rate > 0 and self.random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+    def first_token_delay(self):
+        with self.lock:
+            slow = self.slow_rate > 0 and self.random.random() < self.slow_rate
+            self.slow_requests += slow
+        return self.slow_ttft if slow else self.ttft
+
+def _text(content):
+    # El contenido puede ser una lista de partes (por ejemplo con marcas cache_control)
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content)
+    return content
+
+def _words(count, rng):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+def _section_markdown(section_num, tokens, rng):
+    # Unas 0,75 palabras por token; párrafos con algo de formato y una lista de referencias al final
+    words = int(tokens * 0.75)
+    paragraphs = [f"### Apartado {idx + 1}\n\n**{_words(3, rng)}** {_words(110, rng)}." for idx in range(max(1, words // 120))]
+    references = "\n".join(
+        f"- Autor{section_num}{idx}, A. ({1950 + idx}). *{_words(4, rng).capitalize()}*. Editorial Académica."
+        for idx in range(4)
+    )
+    return "\n\n".join(paragraphs) + f"\n\n## Referencias\n\n{references}"
+
+def build_completion(prompt, response_format, config, rng):
+    """
+    Respuesta simulada según el tipo de prompt. Retorna (texto, tokens de salida).
+    """
+    toc = re.search(r"La tabla debe contener (\d+) secciones", prompt)
+    section = re.search(r"contenido de la sección (\d+)", prompt)
+    part = re.search(r'apartado "[^"]+" de la sección (\d+)', prompt)
+    section_title = re.search(r"Título de la Sección (\d+):", prompt)
+    if "Introducción: [" in prompt:
+        transitions = max((int(num) for num in re.findall(r"^Transición (\d+):", prompt, re.MULTILINE)), default=1)
+        text = "\n".join(
+            [f"Introducción: {_words(60, rng)}."]
+            + [f"Transición {idx}: {_words(25, rng)}." for idx in range(2, transitions + 1)]
+            + [f"Conclusión: {_words(60, rng)}."]
+        )
+    elif part:
+        # Los apartados piden una fracción de la extensión de una sección completa
+        fraction = int(re.search(r"Extensión aproximada: (\d+) tokens", prompt).group(1)) / 3000
+        text = _section_markdown(part.group(1), int(config.section_tokens * fraction), rng)
+    elif "Título del Estudio:" in prompt:
+        text = f"Título del Estudio: Estudio de {_words(4, rng)}\nDescripción: {_words(60, rng)}."
+    elif toc:
+        text = "\n".join(f"Sección {idx}: {_words(5, rng).capitalize()}" for idx in range(1, int(toc.group(1)) + 1))
+    elif section_title:
+        text = f"Título de la Sección {section_title.group(1)}: {_words(5, rng).capitalize()}"
+    elif section:
+        content = _section_markdown(section.group(1), config.section_tokens, rng)
+        if response_format:
+            body, _, refs = content.partition("\n\n## Referencias\n\n")
+            text = json.dumps({
+                "title": _words(5, rng).capitalize(),
+                "content": body,
+                "references": [line[2:] for line in refs.splitlines()]
+            }, ensure_ascii=False)
+        else:
+            text = content
+    else:
+        text = _words(200, rng)
+    return text, max(1, len(text) // 4)
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=()):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if config.should_fail():
+                status = config.random.choice([429, 503])
+                self._send_json(status, {"error": {"message": "error simulado"}}, [("Retry-After", "0")])
+                return
+            prompt = _text(payload["messages"][-1]["content"])
+            rng = random.Random(zlib.crc32(prompt.encode("utf-8")))  # Misma respuesta para el mismo prompt
+            text, completion_tokens = build_completion(prompt, payload.get("response_format"), config, rng)
+            prompt_tokens = sum(len(_text(message["content"])) for message in payload["messages"]) // 4
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "cost": (prompt_tokens * 0.35 + completion_tokens * 0.4) / 1e6
+            }
+            time.sleep(config.first_token_delay())
+            if not payload.get("stream"):
+                time.sleep(completion_tokens / config.tokens_per_second)
+                self._send_json(200, {"model": payload.get("model"), "choices": [{"message": {"role": "assistant", "content": text}}], "usage": usage})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            pieces = re.findall(r"\S+\s*", text) or [text]
+            per_piece = completion_tokens / config.tokens_per_second / len(pieces)
+            batch = max(1, len(pieces) // 200)  # Como mucho unos 200 eventos por respuesta
+            for start in range(0, len(pieces), batch):
+                chunk = {"choices": [{"delta": {"content": "".join(pieces[start:start + batch])}}]}
+                self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                time.sleep(per_piece * batch)
+            self._write_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self._write_chunk(b"")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/search.json":
+                self._send_json(404, {"error": "no encontrado"})
+                return
+            if config.should_fail():
+                self._send_json(503, {"error": "error simulado"}, [("Retry-After", "0")])
+                return
+            time.sleep(config.ttft)
+            query = parse_qs(url.query).get("q", [""])[0]
+            title = re.search(r"title:(.*?)(?: author:|$)", query)
+            author = re.search(r"author:(.*)$", query)
+            self._send_json(200, {"numFound": 1, "docs": [{
+                "key": "/works/OL0W",
+                "title": title.group(1).strip() if title else query,
+                "author_name": [author.group(1).strip()] if author else [],
+                "subject": ["Fiction", "Classic literature", "Society"],
+                "first_sentence": ["Primera frase simulada."]
+            }]})
+
+    return Handler
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # El cliente cierra la conexión tras un error simulado para reintentar; no es un fallo del servidor
+        pass
+
+class MockServices:
+    """
+    Arranca el servidor simulado en un hilo. Se usa como gestor de contexto; expone las
+    URL que sustituyen a las de OpenRouter y Open Library.
+    """
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockConfig()
+        self.server = _QuietServer((host, port), make_handler(self.config))
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openrouter_url(self):
+        return self.base_url + "/api/v1/chat/completions"
+
+    @property
+    def open_library_url(self):
+        return self.base_url + "/search.json"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor simulado de OpenRouter y Open Library.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.5, help="Segundos hasta el primer token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--section-tokens", type=int, default=3000)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Probabilidad de una réplica lenta")
+    parser.add_argument("--slow-ttft", type=float, default=2.0, help="Segundos hasta el primer token de una réplica lenta")
+    args = parser.parse_args()
+    config = MockConfig(args.ttft, args.tokens_per_second, args.section_tokens, args.error_rate,
+                        slow_rate=args.slow_rate, slow_ttft=args.slow_ttft)
+    with MockServices(config, port=args.port) as services:
+        print(f"OpenRouter simulado: {services.openrouter_url}")
+        print(f"Open Library simulado: {services.open_library_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
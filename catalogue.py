@@ -0,0 +1,147 @@
+# catalogue.py
+
+import bisect
+import functools
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+CANDIDATE_TRIGRAMS = 6  # Trigramas menos frecuentes de la consulta que generan candidatos (un error de escritura altera a lo sumo 3)
+MAX_CANDIDATE_POSTING = 1000  # Trigramas más comunes que esto no generan candidatos (consultas cortas usan los prefijos)
+MAX_FUZZY_CANDIDATES = 60  # Candidatos que se puntúan con la similitud completa
+
+def normalize_text(text):
+    """
+    Normaliza un texto para compararlo: sin acentos, en minúsculas, sin signos de
+    puntuación y con espacios simples.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(_NON_ALNUM.sub(" ", text.lower()).split())
+
+def _trigrams(normalized):
+    padded = f"  {normalized} "
+    return {padded[idx:idx + 3] for idx in range(len(padded) - 2)}
+
+class Catalogue:
+    """
+    Catálogo de obras enlazadas con su autor, con una entrada por obra (los títulos se
+    comparan sin acentos ni mayúsculas). Mantiene un índice ordenado de prefijos y un
+    índice de trigramas para sugerencias tolerantes a errores de escritura.
+    """
+
+    def __init__(self, pairs=()):
+        self.entries = []  # Lista de diccionarios: [{'title': ..., 'author': ..., 'key': ...}, ...]
+        self._by_key = {}  # Título normalizado -> posición en self.entries
+        self._entry_trigrams = []  # Trigramas del título de cada obra
+        self._trigram_index = defaultdict(list)  # Trigrama -> posiciones de las obras que lo contienen
+        self._sorted_titles = []  # (título normalizado, posición), ordenado para buscar por prefijo
+        self._sorted_words = []  # (palabra del título o del autor, posición), ordenado
+        self._needs_sort = False  # Los índices ordenados se reordenan una sola vez, en la siguiente consulta
+        for title, author in pairs:
+            self.add(title, author)
+        self._sort_indexes()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, title, author):
+        """
+        Agrega una obra. Si ya existe una con el mismo título normalizado, se conserva la
+        primera y se completa su autor si faltaba. Retorna la entrada del catálogo.
+        """
+        key = normalize_text(title)
+        if not key:
+            return None
+        if key in self._by_key:
+            entry = self.entries[self._by_key[key]]
+            if not entry['author'] and author:
+                entry['author'] = author
+                self._index_words(normalize_text(author), self._by_key[key])
+            return entry
+        idx = len(self.entries)
+        entry = {"title": title, "author": author, "key": key}
+        self.entries.append(entry)
+        self._by_key[key] = idx
+        grams = _trigrams(key)
+        self._entry_trigrams.append(grams)
+        for gram in grams:
+            self._trigram_index[gram].append(idx)
+        self._sorted_titles.append((key, idx))
+        self._index_words(key, idx)
+        self._index_words(normalize_text(author), idx)
+        return entry
+
+    def _index_words(self, normalized, idx):
+        self._sorted_words.extend((word, idx) for word in set(normalized.split()))
+        self._needs_sort = True
+
+    def _sort_indexes(self):
+        if self._needs_sort:
+            self._sorted_titles.sort()
+            self._sorted_words.sort()
+            self._needs_sort = False
+
+    def lookup(self, title):
+        """
+        Retorna la entrada cuyo título coincide (sin acentos ni mayúsculas), o None.
+        """
+        idx = self._by_key.get(normalize_text(title))
+        return self.entries[idx] if idx is not None else None
+
+    def _prefix_range(self, sorted_pairs, prefix):
+        start = bisect.bisect_left(sorted_pairs, (prefix,))
+        end = bisect.bisect_left(sorted_pairs, (prefix + "\uffff",))
+        return (idx for _, idx in sorted_pairs[start:end])
+
+    def suggest(self, query, limit=8):
+        """
+        Sugiere obras para un texto parcial. Prioriza los títulos que empiezan por el texto,
+        luego las obras con una palabra (del título o del autor) que empieza por la última
+        palabra escrita, y ordena todo por similitud de trigramas, que tolera errores de escritura.
+        """
+        normalized = normalize_text(query)
+        if not normalized or not self.entries:
+            return []
+        self._sort_indexes()
+        scores = defaultdict(float)
+        for idx in self._prefix_range(self._sorted_titles, normalized):
+            scores[idx] += 2.0
+            if len(scores) >= limit * 4:
+                break
+        last_word = normalized.rsplit(" ", 1)[-1]
+        if len(last_word) >= 2:
+            for count, idx in enumerate(self._prefix_range(self._sorted_words, last_word)):
+                scores[idx] += 0.5
+                if count >= limit * 8:
+                    break
+
+        # Candidatos difusos: obras que comparten los trigramas menos frecuentes de la consulta
+        query_grams = _trigrams(normalized)
+        postings = sorted((self._trigram_index[gram] for gram in query_grams if gram in self._trigram_index), key=len)
+        shared = Counter()
+        for posting in postings[:CANDIDATE_TRIGRAMS]:
+            if len(posting) > MAX_CANDIDATE_POSTING:
+                break
+            shared.update(posting)
+        candidates = {idx for idx, _ in shared.most_common(MAX_FUZZY_CANDIDATES)}
+        candidates.update(scores)
+        for idx in candidates:
+            entry_grams = self._entry_trigrams[idx]
+            similarity = 2.0 * len(query_grams & entry_grams) / (len(query_grams) + len(entry_grams))
+            if similarity >= 0.3 or idx in scores:
+                scores[idx] += similarity
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.entries[item[0]]['key']))
+        return [self.entries[idx] for idx, _ in ranked[:limit]]
+
+    def pairs(self):
+        return [(entry['title'], entry['author']) for entry in self.entries]
+
+@functools.lru_cache(maxsize=1)
+def default_catalogue():
+    """
+    Catálogo construido a partir de predefined_lists, compartido por todo el proceso.
+    """
+    from predefined_lists import PREDEFINED_CATALOGUE
+    return Catalogue(PREDEFINED_CATALOGUE)
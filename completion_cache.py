@@ -0,0 +1,135 @@
+# completion_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = os.environ.get("OBRASCLASICAS_CACHE_PATH", os.path.join(".cache", "completions.sqlite3"))
+CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # Las respuestas caducan a los 30 días
+CACHE_MAX_BYTES = 200 * 1024 * 1024  # Tamaño máximo del contenido almacenado
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+_initialized_paths = set()
+
+def make_key(model, messages):
+    """
+    Calcula la clave del caché a partir del modelo y los mensajes (hash SHA-256).
+    """
+    payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _connect(path=None):
+    """
+    Abre una conexión a la base de datos del caché, creando la tabla si no existe.
+    """
+    path = path or CACHE_PATH
+    if path not in _initialized_paths:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
+    if path not in _initialized_paths:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_accessed ON completions (accessed_at)")
+        conn.commit()
+        _initialized_paths.add(path)
+    return conn
+
+def get(model, messages, path=None):
+    """
+    Retorna la respuesta almacenada para el modelo y los mensajes, o None si no existe o ha caducado.
+    """
+    key = make_key(model, messages)
+    now = time.time()
+    try:
+        conn = _connect(path)
+        try:
+            row = conn.execute(
+                "SELECT content FROM completions WHERE key = ? AND created_at >= ?",
+                (key, now - CACHE_TTL_SECONDS)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        row = None
+    with _lock:
+        _stats["hits" if row is not None else "misses"] += 1
+    return row[0] if row is not None else None
+
+def put(model, messages, content, path=None):
+    """
+    Guarda una respuesta en el caché y aplica la política de expulsión.
+    """
+    key = make_key(model, messages)
+    now = time.time()
+    try:
+        conn = _connect(path)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, content, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, len(content.encode("utf-8")), now, now)
+            )
+            conn.commit()
+            evicted = _evict(conn, now)
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return
+    with _lock:
+        _stats["writes"] += 1
+        _stats["evictions"] += evicted
+
+def _evict(conn, now):
+    """
+    Elimina las entradas caducadas y, si se supera el tamaño máximo, las menos usadas recientemente.
+    """
+    evicted = conn.execute("DELETE FROM completions WHERE created_at < ?", (now - CACHE_TTL_SECONDS,)).rowcount
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+    if total > CACHE_MAX_BYTES:
+        excess = total - CACHE_MAX_BYTES
+        freed = 0
+        keys = []
+        for key, size in conn.execute("SELECT key, size FROM completions ORDER BY accessed_at ASC"):
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM completions WHERE key = ?", keys)
+        evicted += len(keys)
+    conn.commit()
+    return evicted
+
+def clear(path=None):
+    """
+    Vacía el caché por completo.
+    """
+    conn = _connect(path)
+    try:
+        conn.execute("DELETE FROM completions")
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_stats():
+    """
+    Retorna una copia de los contadores de aciertos, fallos, escrituras y expulsiones.
+    """
+    with _lock:
+        return dict(_stats)
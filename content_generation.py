@@ -1,31 +1,412 @@
 # content_generation.py
 
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import streamlit as st
 import requests
 
-def call_openrouter_api(messages, model="qwen/qwen-2.5-72b-instruct"):
+import completion_cache
+import hedging
+import http_client
+import instrumentation
+import model_router
+import rate_limiter
+from references import ReferenceStore, extract_references, strip_references
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+MAX_COMPLETION_TOKENS = 4000  # Límite estimado de salida por llamada (las secciones piden ~3000 tokens)
+SECTION_TOKENS = 3000  # Extensión que se pide para una sección
+COMPLETION_TIMEOUT = (5, 300)  # (conexión, lectura): una llamada no streaming espera la respuesta entera
+# Modelos que aceptan marcas cache_control para reutilizar el prefijo del prompt (los demás lo hacen automáticamente o no lo admiten)
+CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "google/gemini")
+BOOTSTRAP_WORKERS = 3  # Búsqueda en Open Library, título y descripción, y tabla de contenidos
+
+def _api_key():
+    # Fuera de Streamlit (por ejemplo en la generación por lotes) se puede usar la variable de entorno
+    return os.environ.get("OPENROUTER_API_KEY") or st.secrets['OPENROUTER_API_KEY']
+
+def _record_usage(event, usage):
     """
-    Llama a la API de OpenRouter para obtener una respuesta basada en los mensajes proporcionados.
+    Copia al evento de instrumentación los tokens (y el coste, si el proveedor lo informa)
+    del bloque 'usage'. Retorna el total de tokens o None si no hay bloque.
     """
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {st.secrets['OPENROUTER_API_KEY']}"
-    }
-    data = {
-        "model": model,
-        "messages": messages
-    }
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()['choices'][0]['message']['content'].strip()
-    except requests.exceptions.HTTPError as err:
-        st.error(f"Error en la API de OpenRouter: {err}")
+    if not usage:
         return None
-    except Exception as e:
-        st.error(f"Error inesperado en la API de OpenRouter: {e}")
+    event["prompt_tokens"] = usage.get('prompt_tokens')
+    event["completion_tokens"] = usage.get('completion_tokens')
+    # Tokens de entrada servidos desde el caché de prompts del proveedor
+    event["cached_tokens"] = (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+    if usage.get('cost') is not None:
+        event["cost"] = usage['cost']
+    return usage.get('total_tokens')
+
+def _with_cache_hints(messages, model):
+    """
+    Marca el prefijo estable (el mensaje de sistema) como reutilizable para los modelos que
+    admiten cache_control. Solo cambia el cuerpo enviado, no la clave del caché local.
+    """
+    if not model.startswith(CACHE_CONTROL_MODEL_PREFIXES):
+        return messages
+    hinted = []
+    for message in messages:
+        if message["role"] == "system" and isinstance(message["content"], str):
+            message = {"role": "system", "content": [{"type": "text", "text": message["content"], "cache_control": {"type": "ephemeral"}}]}
+        hinted.append(message)
+    return hinted
+
+def _complete(messages, model, use_cache, response_format, step, attempt):
+    """
+    Una llamada no streaming a un modelo concreto. Retorna el texto de la respuesta;
+    los errores se propagan para que el llamador pruebe el siguiente modelo de la ruta.
+    """
+    with instrumentation.span("openrouter", step, model=model, stream=False, attempt=attempt) as event:
+        if use_cache:
+            cached = completion_cache.get(model, messages)
+            if cached is not None:
+                event["cache"] = "hit"
+                return cached
+        event["cache"] = "miss" if use_cache else "bypass"
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {_api_key()}"
+        }
+        data = {
+            "model": model,
+            "messages": _with_cache_hints(messages, model),
+            "usage": {"include": True}  # Incluir el coste en el bloque 'usage'
+        }
+        if response_format:
+            data["response_format"] = response_format
+        # Esperar turno en el planificador compartido para no superar la cuota del proveedor
+        queued_at = time.perf_counter()
+        reserved = rate_limiter.acquire(rate_limiter.estimate_tokens(messages, MAX_COMPLETION_TOKENS))
+        event["queue_ms"] = round((time.perf_counter() - queued_at) * 1000, 1)
+        used_tokens = 0
+        try:
+            response = http_client.post(OPENROUTER_URL, headers=headers, json=data, timeout=COMPLETION_TIMEOUT)
+            event["ttfb_ms"] = round(response.elapsed.total_seconds() * 1000, 1)
+            event["status"] = response.status_code
+            response.raise_for_status()
+            result = response.json()
+            used_tokens = _record_usage(event, result.get('usage'))
+            content = result['choices'][0]['message']['content'].strip()
+            if not content:
+                raise ValueError("respuesta vacía")
+            completion_cache.put(model, messages, content)
+            return content
+        finally:
+            rate_limiter.reconcile(reserved, used_tokens)
+
+def call_openrouter_api(messages, model=None, use_cache=True, response_format=None, step="chat", hedge=None):
+    """
+    Llama a la API de OpenRouter para obtener una respuesta basada en los mensajes proporcionados.
+    Sin model, se usa la cadena de modelos que model_router asigna al paso (step) y, si un
+    modelo falla, se prueba el siguiente.
+    Si use_cache es True, consulta primero el caché persistente; con False se ignora la copia
+    almacenada, aunque la nueva respuesta sí se guarda. response_format se envía tal cual
+    (por ejemplo {"type": "json_object"}) para pedir una salida estructurada.
+    step identifica el paso de la generación en la ruta de modelos y en las trazas de instrumentation.
+    Con hedge (por defecto, según hedging) la respuesta se pide en streaming para poder
+    duplicarla si tarda en empezar; véase _hedged_stream.
+    """
+    if _should_hedge(model, step, hedge):
+        try:
+            return "".join(_hedged_stream(messages, step, use_cache, response_format)).strip()
+        except requests.exceptions.HTTPError as err:
+            st.error(f"Error en la API de OpenRouter: {err}")
+        except _StreamError as err:
+            st.error(f"Error en la API de OpenRouter: {err}")
+        except Exception as e:
+            st.error(f"Error inesperado en la API de OpenRouter: {e}")
         return None
+    models = [model] if model else model_router.models_for(step)
+    error_message = None
+    for attempt, candidate in enumerate(models):
+        try:
+            return _complete(messages, candidate, use_cache, response_format, step, attempt)
+        except requests.exceptions.HTTPError as err:
+            error_message = f"Error en la API de OpenRouter: {err}"
+        except Exception as e:
+            error_message = f"Error inesperado en la API de OpenRouter: {e}"
+    st.error(error_message)
+    return None
+
+class _StreamError(Exception):
+    """
+    Error informado por el proveedor dentro de una respuesta en streaming.
+    """
+
+class StreamInterrupted(Exception):
+    """
+    La respuesta en streaming no se completó: el texto producido hasta el error está truncado.
+    """
+
+class _Racer:
+    """
+    Una de las peticiones de una carrera con duplicado: el modelo, la marca de cancelación
+    y la respuesta HTTP abierta, que se cierra si la petición pierde.
+    """
+
+    def __init__(self, index, model, hedge, events):
+        self.index = index
+        self.model = model
+        self.hedge = hedge
+        self.events = events  # Cola compartida: (racer, tipo, valor)
+        self.cancelled = threading.Event()
+        self._response = None
+        self._lock = threading.Lock()
+
+    def mark_sent(self):
+        # La petición obtuvo turno en rate_limiter y sale hacia el proveedor
+        self.events.put((self, "sent", None))
+
+    def attach(self, response):
+        with self._lock:
+            self._response = response
+            cancelled = self.cancelled.is_set()
+        if cancelled:
+            response.close()
+
+    def cancel(self):
+        # Cerrar la respuesta interrumpe también una lectura bloqueada esperando el primer token
+        with self._lock:
+            self.cancelled.set()
+            response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+def _stream(messages, model, use_cache, step, attempt, response_format=None, racer=None):
+    """
+    Generador de los fragmentos de una respuesta en streaming de un modelo concreto.
+    Los errores se propagan al llamador. racer (un _Racer) permite cancelar la petición
+    desde otro hilo cuando compite con una duplicada.
+    """
+    fields = {"hedge": True} if racer is not None and racer.hedge else {}
+    with instrumentation.span("openrouter", step, model=model, stream=True, attempt=attempt, **fields) as event:
+        if use_cache:
+            cached = completion_cache.get(model, messages)
+            if cached is not None:
+                event["cache"] = "hit"
+                yield cached
+                return
+        event["cache"] = "miss" if use_cache else "bypass"
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {_api_key()}"
+        }
+        data = {
+            "model": model,
+            "messages": _with_cache_hints(messages, model),
+            "stream": True,
+            "usage": {"include": True}
+        }
+        if response_format:
+            data["response_format"] = response_format
+        queued_at = time.perf_counter()
+        reserved = rate_limiter.acquire(rate_limiter.estimate_tokens(messages, MAX_COMPLETION_TOKENS))
+        event["queue_ms"] = round((time.perf_counter() - queued_at) * 1000, 1)
+        if racer is not None:
+            if racer.cancelled.is_set():
+                # La carrera se decidió mientras la petición esperaba turno: no llega a enviarse
+                event["cancelled"] = True
+                rate_limiter.reconcile(reserved, 0)
+                if racer.hedge:
+                    hedging.default_policy.refund(reserved)
+                return
+            racer.mark_sent()
+        started_at = time.perf_counter()
+        used_tokens = 0
+        parts = []
+        try:
+            with http_client.post(OPENROUTER_URL, headers=headers, json=data, stream=True) as response:
+                event["status"] = response.status_code
+                response.raise_for_status()
+                if racer is not None:
+                    racer.attach(response)
+                # Se leen bytes: SSE siempre es UTF-8 y, sin charset en la cabecera, requests
+                # decodificaría como ISO-8859-1
+                for raw_line in response.iter_lines():
+                    if racer is not None and racer.cancelled.is_set():
+                        event["cancelled"] = True
+                        return
+                    line = raw_line.decode("utf-8")
+                    # Las líneas vacías separan eventos y las que empiezan con ":" son comentarios
+                    if not line or line.startswith(":") or not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    chunk = json.loads(payload)
+                    if chunk.get('usage'):
+                        used_tokens = _record_usage(event, chunk['usage'])
+                    if 'error' in chunk:
+                        raise _StreamError(chunk['error'].get('message', chunk['error']))
+                    choices = chunk.get('choices') or [{}]
+                    content = choices[0].get('delta', {}).get('content')
+                    if content:
+                        if "ttfb_ms" not in event:
+                            # Tiempo hasta el primer token de la respuesta, que ajusta el umbral de hedging
+                            instrumentation.mark_first_byte(event, started_at)
+                            hedging.default_policy.observe_ttft(step, event["ttfb_ms"] / 1000)
+                        parts.append(content)
+                        yield content
+            # Solo se guarda en el caché una respuesta recibida por completo
+            if not parts:
+                raise _StreamError("respuesta vacía")
+            completion_cache.put(model, messages, "".join(parts).strip())
+        except Exception:
+            if racer is not None and racer.cancelled.is_set():
+                # La lectura falló porque se cerró la respuesta de la petición perdedora
+                event["cancelled"] = True
+                return
+            raise
+        finally:
+            if used_tokens == 0 and parts:
+                used_tokens = None  # Sin bloque 'usage' se conserva la estimación
+            rate_limiter.reconcile(reserved, used_tokens)
+
+def _bind_context(function):
+    """
+    Envuelve function para ejecutarla en otro hilo en nombre del llamador: misma sesión y
+    prioridad en rate_limiter y mismo estudio en instrumentation.
+    """
+    lane = rate_limiter.current_lane()
+    study_id = instrumentation.current_study_id()
+
+    def bound(*args, **kwargs):
+        with rate_limiter.lane(*lane), instrumentation.study(study_id):
+            return function(*args, **kwargs)
+    return bound
+
+def _should_hedge(model, step, hedge):
+    if hedge is None:
+        hedge = hedging.ENABLED and step in hedging.STEPS
+    return hedge and not model
+
+def _hedged_stream(messages, step, use_cache, response_format=None):
+    """
+    Generador de una respuesta en streaming con petición duplicada (hedging). Si el primer
+    token no llega dentro del umbral de hedging.default_policy (p90 observado para el paso)
+    y queda presupuesto, se lanza la misma petición al siguiente modelo de la ruta; se sigue
+    con la que produzca texto primero y la otra se cancela. Si una petición falla antes de
+    producir texto se prueba el siguiente modelo, como en call_openrouter_api_stream.
+    """
+    models = model_router.models_for(step)
+    policy = hedging.default_policy
+    estimated = rate_limiter.estimate_tokens(messages, MAX_COMPLETION_TOKENS)
+    policy.record_request(estimated)
+    events = queue.Queue()
+    racers = []
+
+    @_bind_context
+    def run(racer):
+        try:
+            for chunk in _stream(messages, racer.model, use_cache, step, racer.index, response_format, racer):
+                events.put((racer, "chunk", chunk))
+            events.put((racer, "done", None))
+        except Exception as e:
+            events.put((racer, "error", e))
+
+    def start(hedge):
+        racer = _Racer(len(racers), models[min(len(racers), len(models) - 1)], hedge, events)
+        racers.append(racer)
+        threading.Thread(target=run, args=(racer,), daemon=True).start()
+
+    start(hedge=False)
+    try:
+        winner = None
+        deadline = None
+        hedged = False  # Como mucho una petición duplicada
+        failed = 0
+        while winner is None:
+            timeout = None if hedged or deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                racer, kind, value = events.get(timeout=timeout)
+            except queue.Empty:
+                hedged = True
+                if policy.try_spend(estimated):
+                    start(hedge=True)
+                continue
+            if kind == "sent":
+                if racer.index == 0:
+                    deadline = time.monotonic() + policy.delay(step)
+            elif kind == "error":
+                failed += 1
+                hedged = True
+                if len(racers) < len(models):
+                    start(hedge=False)
+                elif failed == len(racers):
+                    raise value
+            else:
+                winner = racer
+        for racer in racers:
+            if racer is not winner:
+                racer.cancel()
+        if winner.hedge:
+            policy.record_hedge_win()
+        if kind == "chunk":
+            yield value
+        while kind != "done":
+            racer, racer_kind, value = events.get()
+            if racer is not winner:
+                continue  # La perdedora también avisa al terminar: solo cuenta el final de la ganadora
+            kind = racer_kind
+            if kind == "error":
+                raise value
+            if kind == "chunk":
+                yield value
+    finally:
+        # Si el consumidor deja de leer, ninguna petición sigue abierta
+        for racer in racers:
+            racer.cancel()
+
+def call_openrouter_api_stream(messages, model=None, use_cache=True, step="chat", hedge=None):
+    """
+    Variante de call_openrouter_api que usa el endpoint SSE (stream: true).
+    Es un generador que produce los fragmentos de texto a medida que llegan.
+    Un acierto del caché se produce como un único fragmento. Se pasa al siguiente modelo
+    de la ruta solo si el anterior falla antes de producir texto.
+    Si ningún modelo completa la respuesta, el error se muestra y se lanza StreamInterrupted,
+    para que el llamador no tome el texto parcial por una respuesta terminada.
+    """
+    if _should_hedge(model, step, hedge):
+        try:
+            yield from _hedged_stream(messages, step, use_cache)
+            return
+        except requests.exceptions.HTTPError as err:
+            error, error_message = err, f"Error en la API de OpenRouter: {err}"
+        except _StreamError as err:
+            error, error_message = err, f"Error en la API de OpenRouter: {err}"
+        except Exception as e:
+            error, error_message = e, f"Error inesperado en la API de OpenRouter: {e}"
+        st.error(error_message)
+        raise StreamInterrupted(error_message) from error
+    models = [model] if model else model_router.models_for(step)
+    for attempt, candidate in enumerate(models):
+        produced = False
+        try:
+            for chunk in _stream(messages, candidate, use_cache, step, attempt):
+                produced = True
+                yield chunk
+            return
+        except requests.exceptions.HTTPError as err:
+            error, error_message = err, f"Error en la API de OpenRouter: {err}"
+        except _StreamError as err:
+            error, error_message = err, f"Error en la API de OpenRouter: {err}"
+        except Exception as e:
+            error, error_message = e, f"Error inesperado en la API de OpenRouter: {e}"
+        if produced:
+            break  # El texto ya mostrado no se puede combinar con el de otro modelo
+    st.error(error_message)
+    raise StreamInterrupted(error_message) from error
 
 def generate_title_description(work_title, author, work_type, description):
     """
@@ -45,7 +426,7 @@ Descripción: [Descripción del estudio]
     messages = [
         {"role": "user", "content": prompt}
     ]
-    response = call_openrouter_api(messages)
+    response = call_openrouter_api(messages, step="title_description")
     if response:
         # Separar el título y la descripción
         lines = response.split('\n')
@@ -78,7 +459,7 @@ Sección {total_sections}: [Título de la Sección {total_sections}]
     messages = [
         {"role": "user", "content": prompt}
     ]
-    response = call_openrouter_api(messages)
+    response = call_openrouter_api(messages, step="table_of_contents")
     if response:
         table = []
         for line in response.split('\n'):
@@ -94,7 +475,41 @@ Sección {total_sections}: [Título de la Sección {total_sections}]
         return table
     return None
 
-def generate_section_title(work_title, author, work_type, section_num):
+def bootstrap_study(work_title, author, work_type, total_sections, on_table_of_contents=None, lookup=True):
+    """
+    Prepara un estudio nuevo como un pequeño grafo de dependencias: la búsqueda en Open Library,
+    el título y la descripción y la tabla de contenidos no dependen entre sí y se piden a la vez,
+    de modo que el estudio está listo en el tiempo de una sola llamada.
+    on_table_of_contents(tabla) se llama desde este hilo en cuanto llega la tabla, sin esperar
+    al título, para poder empezar la primera sección de forma especulativa.
+    Retorna un diccionario con 'title', 'description', 'table_of_contents', 'work' (el resultado
+    de Open Library o None) y 'author' (el indicado o, si no había, el de Open Library).
+    """
+    from open_library import search_open_library
+    result = {"title": None, "description": None, "table_of_contents": None, "work": None}
+    with ThreadPoolExecutor(max_workers=BOOTSTRAP_WORKERS) as executor:
+        futures = {
+            executor.submit(_bind_context(generate_title_description), work_title, author, work_type, ""): "header",
+            executor.submit(_bind_context(generate_table_of_contents), work_title, author, work_type, total_sections): "table_of_contents",
+        }
+        if lookup:
+            futures[executor.submit(_bind_context(search_open_library), work_title, author)] = "work"
+        for future in as_completed(futures):
+            try:
+                value = future.result()
+            except Exception:
+                value = None
+            if futures[future] == "header":
+                result["title"], result["description"] = value or (None, None)
+                continue
+            result[futures[future]] = value
+            if futures[future] == "table_of_contents" and value and on_table_of_contents:
+                on_table_of_contents(value)
+    work = result["work"]
+    result["author"] = author or (", ".join(work.get('author_name') or []) if work else "")
+    return result
+
+def generate_section_title(work_title, author, work_type, section_num, use_cache=True):
     """
     Genera un título único y descriptivo para una sección específica del estudio.
     """
@@ -110,7 +525,7 @@ Título de la Sección {section_num}: [Título Único]
     messages = [
         {"role": "user", "content": prompt}
     ]
-    response = call_openrouter_api(messages)
+    response = call_openrouter_api(messages, use_cache=use_cache, step="section_title")
     if response:
         title = ""
         for line in response.split('\n'):
@@ -120,48 +535,319 @@ Título de la Sección {section_num}: [Título Único]
         return title
     return None
 
-def generate_section(work_title, author, work_type, section_num):
+# Aspectos que debe cubrir el estudio según el tipo de obra: (nombre del tipo, aspectos)
+SECTION_ASPECTS = {
+    "literaria": ("Literatura", ["análisis de personajes", "técnicas narrativas", "contexto histórico", "biografía del autor"]),
+    "filosófica": ("Filosofía", ["estudio del autor", "contexto histórico", "ideas principales", "discusiones académicas en torno a las ideas presentadas"]),
+    "política": ("Política", ["estudio del autor", "contexto histórico", "teorías políticas presentadas", "impacto en la sociedad", "discusiones académicas"]),
+}
+
+def build_study_prefix(work_title, author, work_type, table_of_contents=None):
     """
-    Genera el contenido detallado para una sección específica del estudio.
+    Instrucciones comunes a todas las secciones de un estudio: obra, autor, tipo, tabla de
+    contenidos completa y normas de estilo. No depende de la sección, de modo que el
+    proveedor puede reutilizar en caché este prefijo entre las llamadas del mismo estudio.
     """
-    # Definir el tipo de análisis según el tipo de obra
-    if work_type.lower() == "literaria":
-        analysis_prompt = f"""Escribe el contenido de la sección {section_num} para un estudio detallado de la obra "{work_title}" de {author}.
-        
-Tipo de obra: Literatura
+    work_reference = f'"{work_title}" de {author}' if author else f'"{work_title}"'
+    type_name, aspects = SECTION_ASPECTS.get(work_type.lower(), (work_type, []))
+    if aspects:
+        coverage = f"En conjunto, el estudio debe incluir {', '.join(aspects)} y cualquier otro análisis relevante."
+    else:
+        coverage = "El estudio debe incluir análisis detallado relevante al tipo de obra."
+    prefix = f"""Eres un especialista que escribe un estudio detallado de la obra {work_reference}.
 
-La sección debe incluir análisis de personajes, técnicas narrativas, contexto histórico, biografía del autor y cualquier otro análisis relevante.
+Tipo de obra: {type_name}
 
-El contenido debe ser claro, educativo y bien estructurado, con aproximadamente 3000 tokens. Incluye referencias académicas pertinentes al final de la sección en formato APA.
+{coverage}
 """
-    elif work_type.lower() == "filosófica":
-        analysis_prompt = f"""Escribe el contenido de la sección {section_num} para un estudio detallado de la obra "{work_title}" de {author}.
-        
-Tipo de obra: Filosofía
+    if table_of_contents:
+        prefix += "\nTabla de contenidos del estudio:\n" + "".join(
+            f"Sección {sec['number']}: {sec['title']}\n" for sec in table_of_contents
+        )
+    prefix += """
+Normas de estilo:
+- El contenido debe ser claro, educativo y bien estructurado, en Markdown.
+- Cada sección se centra en su propio tema y no repite lo que corresponde a otras secciones de la tabla de contenidos.
+- Incluye referencias académicas pertinentes al final de cada sección en formato APA, bajo el encabezado "Referencias".
+"""
+    return prefix
+
+def _section_heading(section_num, table_of_contents):
+    section_title = next((sec['title'] for sec in table_of_contents or [] if sec['number'] == section_num), "")
+    return f'la sección {section_num}: "{section_title}"' if section_title else f"la sección {section_num}"
 
-La sección debe incluir estudio del autor, contexto histórico, ideas principales, discusiones académicas en torno a las ideas presentadas y cualquier otro análisis relevante.
+def build_section_messages(work_title, author, work_type, section_num, table_of_contents=None):
+    """
+    Construye los mensajes del prompt para el contenido de una sección: primero el prefijo
+    estable del estudio (mensaje de sistema) y al final la instrucción propia de la sección.
+    table_of_contents es la lista de secciones ({'number', 'title'}) del estudio, si ya existe.
+    """
+    instruction = f"""Escribe el contenido de {_section_heading(section_num, table_of_contents)}.
 
-El contenido debe ser claro, educativo y bien estructurado, con aproximadamente 3000 tokens. Incluye referencias académicas pertinentes al final de la sección en formato APA.
+Extensión aproximada: {SECTION_TOKENS} tokens. Termina con las referencias académicas de la sección en formato APA.
 """
-    elif work_type.lower() == "política":
-        analysis_prompt = f"""Escribe el contenido de la sección {section_num} para un estudio detallado de la obra "{work_title}" de {author}.
-        
-Tipo de obra: Política
+    return [
+        {"role": "system", "content": build_study_prefix(work_title, author, work_type, table_of_contents)},
+        {"role": "user", "content": instruction}
+    ]
 
-La sección debe incluir estudio del autor, contexto histórico, teorías políticas presentadas, impacto en la sociedad, discusiones académicas y cualquier otro análisis relevante.
+def generate_section(work_title, author, work_type, section_num, use_cache=True, table_of_contents=None):
+    """
+    Genera el contenido detallado para una sección específica del estudio.
+    """
+    messages = build_section_messages(work_title, author, work_type, section_num, table_of_contents)
+    response = call_openrouter_api(messages, use_cache=use_cache, step="section")
+    return response
+
+def generate_section_stream(work_title, author, work_type, section_num, use_cache=True, table_of_contents=None):
+    """
+    Igual que generate_section, pero produce el contenido por fragmentos a medida que se genera.
+    Lanza StreamInterrupted si la respuesta no se completa.
+    """
+    messages = build_section_messages(work_title, author, work_type, section_num, table_of_contents)
+    return call_openrouter_api_stream(messages, use_cache=use_cache, step="section")
+
+def build_structured_section_messages(section_messages, section_title=None):
+    """
+    Adapta el prompt de una sección para que el modelo devuelva en una sola respuesta JSON
+    el título, el cuerpo y la lista de referencias por separado.
+    """
+    title_instruction = (
+        f'El título de la sección es "{section_title}"; puedes conservarlo o mejorarlo ligeramente.'
+        if section_title else "Propón un título único y descriptivo para la sección."
+    )
+    format_instruction = f"""{title_instruction}
 
-El contenido debe ser claro, educativo y bien estructurado, con aproximadamente 3000 tokens. Incluye referencias académicas pertinentes al final de la sección en formato APA.
+Responde únicamente con un objeto JSON válido, sin texto adicional, con este formato:
+{{"title": "Título de la sección", "content": "Contenido de la sección en Markdown, sin la lista de referencias", "references": ["Referencia 1 en formato APA", "Referencia 2 en formato APA"]}}
 """
-    else:
-        analysis_prompt = f"""Escribe el contenido de la sección {section_num} para un estudio detallado de la obra "{work_title}" de {author}.
-        
-Tipo de obra: {work_type}
+    messages = [dict(message) for message in section_messages]
+    messages[-1]["content"] = messages[-1]["content"].rstrip() + "\n\n" + format_instruction
+    return messages
+
+def parse_structured_section(response):
+    """
+    Interpreta la respuesta JSON de una sección. Retorna un diccionario con 'title', 'content'
+    y 'references', o None si la respuesta no tiene el formato esperado.
+    """
+    if not response:
+        return None
+    # Tolerar bloques de código u otro texto alrededor del objeto JSON
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(response[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    content = str(data.get("content") or "").strip()
+    if not content:
+        return None
+    references = data.get("references") or []
+    if isinstance(references, str):
+        references = references.split("\n")
+    return {
+        "title": str(data.get("title") or "").strip(),
+        "content": content,
+        "references": [str(ref).strip() for ref in references if str(ref).strip()]
+    }
+
+def generate_structured_section_from_messages(section_messages, section_title=None, use_cache=True):
+    """
+    Genera título, cuerpo y referencias de una sección con una única llamada a la API.
+    """
+    messages = build_structured_section_messages(section_messages, section_title)
+    response_format = {"type": "json_object"}
+    section = parse_structured_section(call_openrouter_api(messages, use_cache=use_cache, response_format=response_format, step="section"))
+    if section is None and use_cache:
+        # Una respuesta mal formada pudo quedar en el caché: se reintenta una vez sin él
+        section = parse_structured_section(call_openrouter_api(messages, use_cache=False, response_format=response_format, step="section_retry"))
+    if section is not None and not section["title"]:
+        section["title"] = section_title or ""
+    return section
+
+def generate_section_structured(work_title, author, work_type, section_num, section_title=None, use_cache=True, table_of_contents=None):
+    """
+    Genera en una sola llamada el título, el contenido y las referencias de una sección.
+    """
+    messages = build_section_messages(work_title, author, work_type, section_num, table_of_contents)
+    return generate_structured_section_from_messages(messages, section_title, use_cache=use_cache)
+
+# Apartados de una sección en el modo por apartados para los tipos de obra sin aspectos en SECTION_ASPECTS
+GENERIC_SECTION_ASPECTS = ["contexto", "análisis del tema", "interpretación y discusiones académicas"]
+MERGE_EXCERPT_CHARS = 400  # Caracteres del principio y del final de cada apartado que ve la pasada de enlace
+
+def section_outline(work_type):
+    """
+    Apartados en los que se divide una sección en el modo por apartados: los aspectos que
+    el estudio debe cubrir según el tipo de obra, como en build_study_prefix.
+    """
+    _, aspects = SECTION_ASPECTS.get(work_type.lower(), (work_type, []))
+    return aspects or GENERIC_SECTION_ASPECTS
+
+def build_section_part_messages(work_title, author, work_type, section_num, aspect, outline, table_of_contents=None):
+    """
+    Mensajes para uno de los apartados de una sección. Comparten con las secciones completas
+    el prefijo estable del estudio y piden una fracción de su extensión.
+    """
+    instruction = f"""Escribe el apartado "{aspect}" de {_section_heading(section_num, table_of_contents)}: trata el tema de la sección desde ese punto de vista.
 
-La sección debe incluir análisis detallado relevante al tipo de obra, estructurado de manera clara y educativa, con aproximadamente 3000 tokens. Incluye referencias académicas pertinentes al final de la sección en formato APA.
+La sección se divide en los apartados {', '.join(f'"{part}"' for part in outline)}, que se escriben por separado y después se unen; no repitas lo que corresponde a los demás ni escribas una introducción o conclusión de toda la sección. Empieza con el encabezado "### {aspect[:1].upper() + aspect[1:]}".
+
+Extensión aproximada: {SECTION_TOKENS // len(outline)} tokens. Termina con las referencias académicas del apartado en formato APA.
 """
-    
-    messages = [
-        {"role": "user", "content": analysis_prompt}
+    return [
+        {"role": "system", "content": build_study_prefix(work_title, author, work_type, table_of_contents)},
+        {"role": "user", "content": instruction}
     ]
-    response = call_openrouter_api(messages)
-    return response
+
+def build_section_merge_messages(work_title, author, work_type, section_num, bodies, table_of_contents=None):
+    """
+    Mensajes de la pasada de enlace: a partir del principio y el final de cada apartado, el
+    modelo escribe solo la introducción, las transiciones y la conclusión de la sección.
+    """
+    excerpts = "\n\n".join(
+        f"Apartado {idx}:\n{body[:MERGE_EXCERPT_CHARS]}\n[...]\n{body[-MERGE_EXCERPT_CHARS:]}" if len(body) > 2 * MERGE_EXCERPT_CHARS
+        else f"Apartado {idx}:\n{body}"
+        for idx, body in enumerate(bodies, start=1)
+    )
+    transitions = "".join(f"Transición {idx}: [una o dos frases que enlacen el apartado {idx - 1} con el {idx}]\n" for idx in range(2, len(bodies) + 1))
+    instruction = f"""Los siguientes apartados forman {_section_heading(section_num, table_of_contents)} y se escribieron por separado. Escribe únicamente los textos que los unen, sin repetir su contenido.
+
+{excerpts}
+
+Formato de respuesta:
+Introducción: [un párrafo que presente la sección y sus apartados]
+{transitions}Conclusión: [un párrafo que cierre la sección]
+"""
+    return [
+        {"role": "system", "content": build_study_prefix(work_title, author, work_type, table_of_contents)},
+        {"role": "user", "content": instruction}
+    ]
+
+def parse_section_merge(response):
+    """
+    Interpreta la respuesta de la pasada de enlace. Retorna {'introduction', 'transitions'
+    (número de apartado -> texto), 'conclusion'}; los textos que falten quedan vacíos.
+    """
+    links = {"introduction": "", "transitions": {}, "conclusion": ""}
+    for line in (response or "").split('\n'):
+        label, _, text = line.partition(":")
+        label, text = label.strip(), text.strip()
+        if not text:
+            continue
+        if label == "Introducción":
+            links["introduction"] = text
+        elif label == "Conclusión":
+            links["conclusion"] = text
+        elif label.startswith("Transición"):
+            try:
+                links["transitions"][int(label.split(" ")[1])] = text
+            except (IndexError, ValueError):
+                continue  # Salta líneas que no cumplen el formato esperado
+    return links
+
+def stitch_section(outline, bodies, links):
+    """
+    Une los apartados con la introducción, las transiciones y la conclusión de la pasada de enlace.
+    """
+    blocks = [links["introduction"]]
+    for idx, (aspect, body) in enumerate(zip(outline, bodies), start=1):
+        blocks.append(links["transitions"].get(idx, ""))
+        # Los apartados deberían empezar con su encabezado; si no, se agrega
+        blocks.append(body if body.lstrip().startswith("#") else f"### {aspect[:1].upper() + aspect[1:]}\n\n{body}")
+    blocks.append(links["conclusion"])
+    return "\n\n".join(block for block in blocks if block)
+
+def generate_section_drafted(work_title, author, work_type, section_num, section_title=None, use_cache=True, table_of_contents=None, on_part=None, cancel=None):
+    """
+    Modo por apartados: genera a la vez los apartados de section_outline (cada uno con una
+    fracción de la extensión) y los une con una pasada corta de enlace, de modo que la
+    sección tarda lo que el apartado más largo y no lo que la sección entera.
+    on_part(índice, texto) se llama con cada apartado terminado. Retorna un diccionario
+    como generate_section_structured; si falta algún apartado, la sección se genera en una
+    sola llamada. Si cancel (un threading.Event) se activa, no se hace la pasada de enlace
+    ni la llamada de respaldo y se retorna None.
+    """
+    outline = section_outline(work_type)
+    texts = [None] * len(outline)
+    with ThreadPoolExecutor(max_workers=len(outline) + 1) as executor:
+        title_future = None if section_title else executor.submit(
+            _bind_context(generate_section_title), work_title, author, work_type, section_num, use_cache
+        )
+        futures = {
+            executor.submit(
+                _bind_context(call_openrouter_api),
+                build_section_part_messages(work_title, author, work_type, section_num, aspect, outline, table_of_contents),
+                use_cache=use_cache, step="section_part"
+            ): idx
+            for idx, aspect in enumerate(outline)
+        }
+        for future in as_completed(futures):
+            try:
+                text = future.result()
+            except Exception:
+                text = None
+            texts[futures[future]] = text
+            if text and on_part:
+                on_part(futures[future], strip_references(text))
+        title = section_title or title_future.result()
+    if cancel is not None and cancel.is_set():
+        return None
+    if not all(texts):
+        return generate_section_structured(work_title, author, work_type, section_num, section_title, use_cache, table_of_contents)
+    bodies = [strip_references(text) for text in texts]
+    # Las referencias de los apartados se unen sin duplicados
+    references = ReferenceStore(ref for text in texts for ref in extract_references(text)).texts()
+    merge_messages = build_section_merge_messages(work_title, author, work_type, section_num, bodies, table_of_contents)
+    links = parse_section_merge(call_openrouter_api(merge_messages, use_cache=use_cache, step="section_merge"))
+    return {
+        "title": title or "",
+        "content": stitch_section(outline, bodies, links),
+        "references": references
+    }
+
+def generate_section_record(work_title, author, work_type, section_num, section_title, session_id=None, study_id=None, table_of_contents=None, parts=False):
+    """
+    Genera una sección completa desde un hilo de trabajo, en la cola de baja prioridad
+    y a nombre de la sesión (o del estudio) que la pidió. Con parts=True se usa el modo por apartados.
+    """
+    with rate_limiter.lane(session_id, rate_limiter.PRIORITY_BULK), instrumentation.study(study_id):
+        if parts:
+            return generate_section_drafted(work_title, author, work_type, section_num, section_title, table_of_contents=table_of_contents)
+        return generate_section_structured(work_title, author, work_type, section_num, section_title, table_of_contents=table_of_contents)
+
+def generate_pending_sections(document, work_title, author, work_type, max_workers, on_section_done=None, session_id=None, parts=False):
+    """
+    Genera todas las secciones sin contenido de un StudyDocument usando un pool de hilos acotado.
+    Cada resultado se guarda en su sección del documento, de modo que el orden se conserva
+    sin importar qué sección termine primero.
+    Retorna la lista de números de sección que no se pudieron generar.
+    """
+    pending = document.pending_sections()
+    failed = []
+    if not pending:
+        return failed
+    study_id = instrumentation.current_study_id()  # Los hilos del pool no heredan el contexto del llamador
+    # Todas las secciones comparten la misma tabla de contenidos, y con ella el mismo prefijo del prompt
+    table_of_contents = [{"number": sec['number'], "title": sec['title']} for sec in document.sections]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+        futures = {
+            executor.submit(generate_section_record, work_title, author, work_type, sec['number'], sec['title'], session_id, study_id, table_of_contents, parts): sec['number']
+            for sec in pending
+        }
+        for future in as_completed(futures):
+            sec_num = futures[future]
+            try:
+                record = future.result()
+            except Exception:
+                record = None
+            if not record:
+                failed.append(sec_num)
+                continue
+            document.update_section(sec_num, title=record['title'], content=record['content'], references=record['references'])
+            if on_section_done:
+                on_section_done(sec_num)
+    return sorted(failed)
@@ -0,0 +1,179 @@
+# content_store.py
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+STORE_PATH = os.environ.get("OBRASCLASICAS_CONTENT_STORE_PATH", os.path.join(".cache", "contents.sqlite3"))
+MEMORY_CACHE_MAX_BYTES = 16 * 1024 * 1024  # Textos recientes en memoria, compartidos por todas las sesiones del proceso
+# Tiempo que se conserva un texto que ninguna sección guardada usa: otras sesiones abiertas
+# y los trabajos terminados (véase job_runner.JOB_RETENTION_SECONDS) pueden seguir mostrándolo
+ORPHAN_GRACE_SECONDS = 24 * 60 * 60
+
+_lock = threading.Lock()
+_memory = OrderedDict()  # Identificador -> texto, del menos al más usado recientemente
+_memory_bytes = 0
+_stats = {"hits": 0, "misses": 0, "writes": 0}
+_initialized_paths = set()
+
+def content_id(text):
+    """
+    Identificador de un texto (hash SHA-256): el mismo texto se guarda una sola vez.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _connect(path=None):
+    """
+    Abre una conexión al almacén de textos, creando la tabla si no existe.
+    """
+    path = path or STORE_PATH
+    if path not in _initialized_paths:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
+    if path not in _initialized_paths:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS contents (
+                id TEXT PRIMARY KEY,
+                content TEXT NOT NULL
+            )
+        """)
+        # Textos que dejaron de usarse y desde cuándo; se borran pasado ORPHAN_GRACE_SECONDS
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS orphans (
+                id TEXT PRIMARY KEY,
+                since REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        _initialized_paths.add(path)
+    return conn
+
+def _remember(key, text):
+    """
+    Guarda el texto en la caché en memoria y descarta los menos usados si se supera su tamaño.
+    """
+    global _memory_bytes
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            return
+        _memory[key] = text
+        _memory_bytes += sys.getsizeof(text)
+        while _memory_bytes > MEMORY_CACHE_MAX_BYTES and len(_memory) > 1:
+            _, evicted = _memory.popitem(last=False)
+            _memory_bytes -= sys.getsizeof(evicted)
+
+def put_many(texts, path=None):
+    """
+    Guarda varios textos en una sola transacción. Retorna sus identificadores en el mismo
+    orden (None para los textos vacíos). A diferencia de completion_cache, los errores se
+    propagan: el almacén es la única copia del texto que conservan las sesiones.
+    Un texto que se vuelve a guardar deja de estar marcado como huérfano.
+    """
+    keys = [content_id(text) if text else None for text in texts]
+    rows = [(key, text) for key, text in zip(keys, texts) if key]
+    if not rows:
+        return keys
+    conn = _connect(path)
+    try:
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO contents (id, content) VALUES (?, ?)", rows)
+            conn.executemany("DELETE FROM orphans WHERE id = ?", [(key,) for key, _ in rows])
+    finally:
+        conn.close()
+    for key, text in rows:
+        _remember(key, text)
+    with _lock:
+        _stats["writes"] += len(rows)
+    return keys
+
+def put(text, path=None):
+    """
+    Guarda un texto y retorna su identificador, o None si el texto está vacío.
+    """
+    return put_many([text], path)[0]
+
+def get(key, path=None):
+    """
+    Retorna el texto con el identificador indicado ("" si es None o no existe).
+    """
+    if not key:
+        return ""
+    with _lock:
+        text = _memory.get(key)
+        if text is not None:
+            _memory.move_to_end(key)
+            _stats["hits"] += 1
+            return text
+        _stats["misses"] += 1
+    conn = _connect(path)
+    try:
+        row = conn.execute("SELECT content FROM contents WHERE id = ?", (key,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return ""
+    _remember(key, row[0])
+    return row[0]
+
+def mark_orphans(keys, path=None):
+    """
+    Marca textos que dejaron de usarse. No se borran aún: collect_orphans los borra pasado
+    el periodo de gracia si nadie los volvió a guardar.
+    """
+    keys = {key for key in keys if key}
+    if not keys:
+        return
+    now = time.time()
+    conn = _connect(path)
+    try:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO orphans (id, since) VALUES (?, ?)", [(key, now) for key in keys])
+    finally:
+        conn.close()
+
+def orphans(older_than, path=None):
+    """
+    Identificadores marcados como huérfanos antes de older_than (marca de tiempo).
+    """
+    conn = _connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM orphans WHERE since <= ?", (older_than,))]
+    finally:
+        conn.close()
+
+def collect_orphans(keys, older_than, keep=(), path=None):
+    """
+    Borra los textos de keys que siguen marcados como huérfanos desde antes de older_than;
+    los de keep (los que alguna sección usa) solo se desmarcan. La comprobación y el borrado
+    van en la misma transacción, de modo que un put concurrente del mismo texto lo conserva.
+    La caché en memoria no se toca. Retorna el número de textos borrados.
+    """
+    keep = set(keep)
+    conn = _connect(path)
+    try:
+        with conn:
+            conn.executemany("DELETE FROM orphans WHERE id = ?", [(key,) for key in keep])
+            removed = 0
+            for key in set(keys) - keep:
+                removed += conn.execute(
+                    "DELETE FROM contents WHERE id = ? AND id IN (SELECT id FROM orphans WHERE since <= ?)", (key, older_than)
+                ).rowcount
+                conn.execute("DELETE FROM orphans WHERE id = ? AND since <= ?", (key, older_than))
+    finally:
+        conn.close()
+    return removed
+
+def get_stats():
+    """
+    Retorna los contadores de la caché en memoria y su tamaño actual en bytes.
+    """
+    with _lock:
+        return dict(_stats, memory_bytes=_memory_bytes, memory_entries=len(_memory))
@@ -0,0 +1,81 @@
+# hedging.py
+
+import os
+import threading
+from collections import deque
+
+from instrumentation import percentile
+
+ENABLED = os.environ.get("OBRASCLASICAS_HEDGE", "") == "1"  # Peticiones duplicadas desactivadas por defecto
+STEPS = ("section", "section_retry", "section_part")  # Pasos cuya latencia justifica duplicar peticiones
+HEDGE_PERCENTILE = 90  # Se duplica la petición si el primer token tarda más que este percentil
+MIN_SAMPLES = 20  # Observaciones necesarias antes de usar el percentil
+DEFAULT_DELAY_SECONDS = 8.0  # Umbral mientras no hay suficientes observaciones
+MIN_DELAY_SECONDS = 1.0
+MAX_SAMPLES = 200  # Observaciones recientes que se conservan por paso
+BUDGET_FRACTION = 0.1  # Tokens estimados de las duplicadas: como mucho el 10 % de los de las peticiones normales
+BUDGET_BURST_TOKENS = 10000  # Margen inicial para poder duplicar antes de acumular presupuesto
+
+class HedgePolicy:
+    """
+    Decide cuándo duplicar una petición en streaming: el umbral es el percentil 90 del tiempo
+    hasta el primer token observado en cada paso, y el gasto extra se limita a una fracción
+    de los tokens estimados de todas las peticiones.
+    """
+
+    def __init__(self, fraction=BUDGET_FRACTION, burst_tokens=BUDGET_BURST_TOKENS):
+        self.fraction = fraction
+        self.burst_tokens = burst_tokens
+        self._lock = threading.Lock()
+        self._samples = {}  # Paso -> deque de segundos hasta el primer token
+        self._requested_tokens = 0
+        self._hedged_tokens = 0
+        self._stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "declined": 0}
+
+    def observe_ttft(self, step, seconds):
+        with self._lock:
+            self._samples.setdefault(step, deque(maxlen=MAX_SAMPLES)).append(seconds)
+
+    def delay(self, step):
+        """
+        Segundos que se espera el primer token antes de duplicar la petición.
+        """
+        with self._lock:
+            samples = list(self._samples.get(step, ()))
+        if len(samples) < MIN_SAMPLES:
+            return DEFAULT_DELAY_SECONDS
+        return max(MIN_DELAY_SECONDS, percentile(samples, HEDGE_PERCENTILE))
+
+    def record_request(self, estimated_tokens):
+        with self._lock:
+            self._requested_tokens += estimated_tokens
+            self._stats["requests"] += 1
+
+    def try_spend(self, estimated_tokens):
+        """
+        Reserva presupuesto para una petición duplicada. Retorna False si se agotó.
+        """
+        with self._lock:
+            if self._hedged_tokens + estimated_tokens > self.fraction * self._requested_tokens + self.burst_tokens:
+                self._stats["declined"] += 1
+                return False
+            self._hedged_tokens += estimated_tokens
+            self._stats["hedges"] += 1
+            return True
+
+    def refund(self, estimated_tokens):
+        """
+        Devuelve el presupuesto de una petición duplicada que se canceló antes de enviarse.
+        """
+        with self._lock:
+            self._hedged_tokens = max(0, self._hedged_tokens - estimated_tokens)
+
+    def record_hedge_win(self):
+        with self._lock:
+            self._stats["hedge_wins"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, hedged_tokens=self._hedged_tokens, requested_tokens=self._requested_tokens)
+
+default_policy = HedgePolicy()
@@ -0,0 +1,139 @@
+# http_client.py
+
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = (5, 120)  # (conexión, lectura) en segundos
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}  # 429 se reintenta respetando Retry-After, pero no abre el circuito
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}  # Métodos que se pueden reenviar tras un timeout de lectura
+POOL_MAXSIZE = 16  # Conexiones reutilizables por host (debe cubrir la generación en paralelo)
+CIRCUIT_FAILURE_THRESHOLD = 5  # Fallos consecutivos (errores de conexión y 5xx) que abren el circuito
+CIRCUIT_RESET_SECONDS = 30.0  # Tiempo que el circuito permanece abierto antes de volver a probar
+
+_lock = threading.Lock()
+_sessions = {}
+_circuits = {}
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Se lanza cuando el circuito de un host está abierto y la petición no se envía.
+    """
+
+def get_session(url):
+    """
+    Retorna la sesión compartida (con pool de conexiones y keep-alive) para el host de la URL.
+    """
+    host = urlparse(url).netloc
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+def _circuit_allows(host):
+    """
+    Indica si el circuito del host permite enviar una petición. Tras el tiempo de espera
+    deja pasar una única petición de prueba (estado semiabierto).
+    """
+    with _lock:
+        circuit = _circuits.setdefault(host, {"failures": 0, "open_until": 0.0, "probing": False})
+        if circuit["failures"] < CIRCUIT_FAILURE_THRESHOLD:
+            return True
+        if time.monotonic() < circuit["open_until"] or circuit["probing"]:
+            return False
+        circuit["probing"] = True
+        return True
+
+def _record_result(host, success):
+    with _lock:
+        circuit = _circuits.setdefault(host, {"failures": 0, "open_until": 0.0, "probing": False})
+        circuit["probing"] = False
+        if success:
+            circuit["failures"] = 0
+        else:
+            circuit["failures"] += 1
+            if circuit["failures"] >= CIRCUIT_FAILURE_THRESHOLD:
+                circuit["open_until"] = time.monotonic() + CIRCUIT_RESET_SECONDS
+
+def _retry_after_seconds(response):
+    """
+    Interpreta la cabecera Retry-After (segundos o fecha HTTP). Retorna None si no existe.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+def _backoff_seconds(attempt):
+    # Retroceso exponencial con jitter completo
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+def request(method, url, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES, **kwargs):
+    """
+    Envía una petición usando la sesión compartida del host, con timeouts, reintentos
+    con retroceso exponencial ante 429/5xx o errores de conexión y un circuit breaker por host.
+    Un POST solo se reintenta si no llegó a conectar: tras un timeout de lectura el proveedor
+    pudo haber procesado (y cobrado) la petición, así que el error se propaga.
+    Retorna el objeto Response; los errores HTTP se dejan a raise_for_status del llamador.
+    """
+    host = urlparse(url).netloc
+    if not _circuit_allows(host):
+        raise CircuitOpenError(f"Circuito abierto para {host}; se omite la petición.")
+    session = get_session(url)
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            _record_result(host, False)
+            # ConnectTimeout es un ConnectionError; ReadTimeout solo es un Timeout
+            sent = not isinstance(e, requests.exceptions.ConnectionError)
+            if (sent and not idempotent) or attempt >= max_retries or not _circuit_allows(host):
+                raise
+            time.sleep(_backoff_seconds(attempt))
+            continue
+        except BaseException:
+            # Cualquier otro error (SSL, cabeceras inválidas...) también cuenta como fallo y,
+            # sobre todo, libera la petición de prueba del circuito semiabierto
+            _record_result(host, False)
+            raise
+        if response.status_code in RETRY_STATUSES:
+            # Un 429 indica que el host responde: la cuota la regula rate_limiter, no el circuito
+            _record_result(host, response.status_code == 429)
+            if attempt < max_retries and _circuit_allows(host):
+                delay = _retry_after_seconds(response)
+                if delay is None:
+                    delay = _backoff_seconds(attempt)
+                response.close()
+                time.sleep(min(delay, BACKOFF_MAX_SECONDS * 2))
+                continue
+        else:
+            _record_result(host, True)
+        return response
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
@@ -0,0 +1,156 @@
+# instrumentation.py
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_PATH = os.environ.get("OBRASCLASICAS_TRACE_PATH", os.path.join(".cache", "trace.jsonl"))
+MAX_RECENT_EVENTS = 5000  # Eventos que se conservan en memoria para el panel de métricas
+
+_lock = threading.Lock()
+_recent = deque(maxlen=MAX_RECENT_EVENTS)
+_context = threading.local()
+_trace_dir_ready = False
+
+@contextmanager
+def study(study_id):
+    """
+    Asocia las llamadas hechas desde este hilo al estudio indicado.
+    """
+    previous = getattr(_context, "study_id", None)
+    _context.study_id = study_id
+    try:
+        yield
+    finally:
+        _context.study_id = previous
+
+def current_study_id():
+    return getattr(_context, "study_id", None)
+
+def record(event):
+    """
+    Guarda un evento en memoria y lo añade como una línea JSON al archivo de trazas.
+    """
+    global _trace_dir_ready
+    line = json.dumps(event, ensure_ascii=False)
+    with _lock:
+        _recent.append(event)
+        try:
+            if not _trace_dir_ready:
+                directory = os.path.dirname(TRACE_PATH)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                _trace_dir_ready = True
+            with open(TRACE_PATH, "a", encoding="utf-8") as trace_file:
+                trace_file.write(line + "\n")
+        except OSError:
+            pass
+
+@contextmanager
+def span(service, operation, **fields):
+    """
+    Mide una llamada a un servicio externo. El llamador completa el diccionario que se
+    entrega (por ejemplo 'ttfb_ms', 'prompt_tokens', 'completion_tokens', 'cache' o 'error');
+    al salir se agregan el tiempo total y el estudio, y se registra el evento.
+    Una excepción se anota como error y se vuelve a lanzar.
+    """
+    event = {"ts": time.time(), "service": service, "operation": operation, "study_id": current_study_id(), **fields}
+    start = time.perf_counter()
+    try:
+        yield event
+    except GeneratorExit:
+        # El consumidor de un generador (respuesta en streaming) dejó de leerlo
+        event["cancelled"] = True
+        raise
+    except BaseException as e:
+        event.setdefault("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        event["wall_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        record(event)
+
+def mark_first_byte(event, start):
+    """
+    Anota en el evento el tiempo hasta el primer byte (o primer fragmento) si aún no se anotó.
+    """
+    if "ttfb_ms" not in event:
+        event["ttfb_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+def recent_events():
+    with _lock:
+        return list(_recent)
+
+def load_trace(path=None):
+    """
+    Lee todos los eventos del archivo de trazas (para analizar ejecuciones anteriores).
+    """
+    events = []
+    try:
+        with open(path or TRACE_PATH, encoding="utf-8") as trace_file:
+            for line in trace_file:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return events
+
+def percentile(values, q):
+    """
+    Percentil q (0-100) por el método del rango más cercano; None si no hay valores.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def summarize(events):
+    """
+    Agrupa los eventos por servicio y operación: llamadas, errores, aciertos de caché,
+    latencia p50/p95, tiempo hasta el primer byte p50/p95, tokens (incluidos los de entrada
+    servidos desde el caché de prompts del proveedor) y coste.
+    """
+    groups = {}
+    for event in events:
+        groups.setdefault((event.get("service"), event.get("operation")), []).append(event)
+    rows = []
+    for (service, operation), group in sorted(groups.items(), key=lambda item: (str(item[0][0]), str(item[0][1]))):
+        remote = [event for event in group if event.get("cache") != "hit"]
+        latencies = [event["wall_ms"] for event in remote if "wall_ms" in event and not event.get("error") and not event.get("cancelled")]
+        ttfbs = [event["ttfb_ms"] for event in remote if "ttfb_ms" in event]
+        rows.append({
+            "servicio": service,
+            "operación": operation,
+            "llamadas": len(group),
+            "errores": sum(1 for event in group if event.get("error")),
+            "caché": sum(1 for event in group if event.get("cache") == "hit"),
+            "p50 ms": percentile(latencies, 50),
+            "p95 ms": percentile(latencies, 95),
+            "ttfb p50 ms": percentile(ttfbs, 50),
+            "ttfb p95 ms": percentile(ttfbs, 95),
+            "tokens entrada": sum(event.get("prompt_tokens") or 0 for event in group),
+            "tokens en caché": sum(event.get("cached_tokens") or 0 for event in group),
+            "tokens salida": sum(event.get("completion_tokens") or 0 for event in group),
+            "coste": round(sum(event.get("cost") or 0 for event in group), 6),
+        })
+    return rows
+
+def tokens_by_study(events):
+    """
+    Retorna {estudio: {'llamadas', 'tokens', 'coste', 'segundos'}} para las llamadas a OpenRouter.
+    """
+    studies = {}
+    for event in events:
+        if event.get("service") != "openrouter" or not event.get("study_id"):
+            continue
+        totals = studies.setdefault(event["study_id"], {"llamadas": 0, "tokens": 0, "coste": 0.0, "segundos": 0.0})
+        totals["llamadas"] += 1
+        totals["tokens"] += (event.get("prompt_tokens") or 0) + (event.get("completion_tokens") or 0)
+        totals["coste"] += event.get("cost") or 0
+        totals["segundos"] += (event.get("wall_ms") or 0) / 1000
+    return studies
@@ -0,0 +1,229 @@
+# job_runner.py
+
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import content_store
+import instrumentation
+import rate_limiter
+import study_store
+
+# Trabajos que se ejecutan a la vez en todo el proceso, por prioridad: los interactivos tienen
+# sus propios hilos para no esperar a que terminen los "Generar Todas las Secciones" de otras sesiones
+JOB_WORKERS = {rate_limiter.PRIORITY_INTERACTIVE: 4, rate_limiter.PRIORITY_BULK: 4}
+JOB_RETENTION_SECONDS = 60 * 60  # Los trabajos terminados se olvidan pasada una hora
+
+STATUS_QUEUED = "en cola"
+STATUS_RUNNING = "en curso"
+STATUS_DONE = "terminado"
+STATUS_FAILED = "con errores"
+STATUS_CANCELLED = "cancelado"
+
+_lock = threading.Lock()
+_jobs = {}
+_executors = {}  # Prioridad -> ThreadPoolExecutor
+_counter = itertools.count(1)
+
+class Job:
+    """
+    Trabajo de generación de una o varias secciones de un estudio. Lo ejecuta un hilo del
+    proceso, independiente de las reejecuciones del script de Streamlit; la interfaz solo
+    consulta su estado, el texto parcial y las secciones terminadas.
+    """
+
+    def __init__(self, study_id, sections, use_cache, stream, priority, session_id, max_workers, table_of_contents=None, parts=False, save=True):
+        self.id = f"{next(_counter)}-{uuid.uuid4().hex[:6]}"
+        self.study_id = study_id
+        self.save = save  # Si las secciones terminadas se guardan en study_store (véase start_saving)
+        self.sections = sections  # Lista de (número, título) a generar
+        self.table_of_contents = table_of_contents  # Secciones de todo el estudio, para el prefijo común del prompt
+        self.use_cache = use_cache
+        self.stream = stream
+        self.parts = parts  # Modo por apartados: cada sección se redacta en partes paralelas y se une al final
+        self.priority = priority
+        self.session_id = session_id
+        self.max_workers = max_workers
+        self.status = STATUS_QUEUED
+        self.partial = {}  # Número de sección -> texto recibido hasta el momento (modo stream)
+        self.completed = {}  # Número de sección -> {'number', 'title', 'content_id', 'references'}
+        self.failed = []
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._taken = set()
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Ordena _complete y start_saving para que ninguna sección quede sin guardar
+
+    @property
+    def section_numbers(self):
+        return [number for number, _ in self.sections]
+
+    def is_active(self):
+        return self.status in (STATUS_QUEUED, STATUS_RUNNING)
+
+    def cancel(self):
+        # Las secciones en cola no se empiezan; las que están en streaming se cortan y nada se guarda
+        self._cancel.set()
+
+    def start_saving(self):
+        """
+        Guarda en study_store las secciones ya terminadas y, desde ahora, las que terminen.
+        Un trabajo creado con save=False (la sección especulativa, que empieza antes de que
+        exista el estudio) no escribe nada hasta que se llama a este método.
+        """
+        with self._save_lock:
+            self.save = True
+            with self._lock:
+                records = [dict(record) for record in self.completed.values()]
+            for record in records:
+                study_store.save_section(self.study_id, record)
+
+    def take_completed(self):
+        """
+        Retorna las secciones terminadas que aún no se habían entregado a la interfaz.
+        """
+        with self._lock:
+            fresh = [record for number, record in sorted(self.completed.items()) if number not in self._taken]
+            self._taken.update(record['number'] for record in fresh)
+        return fresh
+
+    def partial_text(self, number):
+        with self._lock:
+            return self.partial.get(number, "")
+
+    def _append_partial(self, number, chunk):
+        with self._lock:
+            self.partial[number] = self.partial.get(number, "") + chunk
+
+    def _complete(self, record):
+        # El texto se guarda una sola vez en content_store; el trabajo (que se conserva un tiempo
+        # después de terminar) y study_store solo guardan su identificador
+        completed = {key: value for key, value in record.items() if key != 'content'}
+        completed['content_id'] = content_store.put(record['content'])
+        with self._save_lock:
+            if self.study_id and self.save:
+                study_store.save_section(self.study_id, completed)
+            with self._lock:
+                self.completed[record['number']] = completed
+                self.partial.pop(record['number'], None)
+
+    def _fail(self, number):
+        with self._lock:
+            self.failed.append(number)
+            self.partial.pop(number, None)
+
+def _get_executor(priority):
+    with _lock:
+        if priority not in _executors:
+            _executors[priority] = ThreadPoolExecutor(max_workers=JOB_WORKERS[priority], thread_name_prefix=f"job-{priority}")
+        return _executors[priority]
+
+def _prune(now):
+    for job_id, job in list(_jobs.items()):
+        if job.finished_at is not None and now - job.finished_at > JOB_RETENTION_SECONDS:
+            del _jobs[job_id]
+
+def _generate_one(job, work_title, author, work_type, number, title):
+    """
+    Genera una sección del trabajo. Retorna el registro de la sección o None si falló.
+    """
+    from content_generation import StreamInterrupted, generate_section_drafted, generate_section_stream, generate_section_structured, generate_section_title
+    from references import extract_references
+    if job.parts:
+        # En modo stream, los apartados se muestran a medida que terminan
+        on_part = (lambda idx, text: job._append_partial(number, text + "\n\n")) if job.stream else None
+        record = generate_section_drafted(work_title, author, work_type, number, title, use_cache=job.use_cache,
+                                          table_of_contents=job.table_of_contents, on_part=on_part, cancel=job._cancel)
+    elif job.stream:
+        title = title or generate_section_title(work_title, author, work_type, number, use_cache=job.use_cache)
+        if not title:
+            return None
+        chunks = generate_section_stream(work_title, author, work_type, number, use_cache=job.use_cache, table_of_contents=job.table_of_contents)
+        try:
+            for chunk in chunks:
+                if job._cancel.is_set():
+                    chunks.close()  # Cierra la respuesta en curso para no pagar el resto de la sección
+                    return None
+                job._append_partial(number, chunk)
+        except StreamInterrupted:
+            return None  # El texto recibido está truncado: la sección se marca como fallida y no se guarda
+        content = job.partial_text(number).strip()
+        if not content:
+            return None
+        return {"number": number, "title": title, "content": content, "references": extract_references(content)}
+    else:
+        record = generate_section_structured(work_title, author, work_type, number, title, use_cache=job.use_cache, table_of_contents=job.table_of_contents)
+    if not record:
+        return None
+    return {"number": number, "title": record['title'], "content": record['content'], "references": record['references']}
+
+def _run(job, work_title, author, work_type):
+    job.status = STATUS_RUNNING
+
+    def run_section(number, title):
+        if job._cancel.is_set():
+            return number, None
+        with rate_limiter.lane(job.session_id, job.priority), instrumentation.study(job.study_id):
+            return number, _generate_one(job, work_title, author, work_type, number, title)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(job.max_workers, len(job.sections)))) as executor:
+            futures = [executor.submit(run_section, number, title) for number, title in job.sections]
+            for future in as_completed(futures):
+                try:
+                    number, record = future.result()
+                except Exception as e:
+                    job.error = str(e)
+                    continue
+                if job._cancel.is_set():
+                    continue  # Un trabajo cancelado no guarda nada, aunque la sección haya terminado
+                if record:
+                    job._complete(record)
+                else:
+                    job._fail(number)
+        if job._cancel.is_set():
+            job.status = STATUS_CANCELLED
+        elif job.failed or job.error:
+            job.status = STATUS_FAILED
+        else:
+            job.status = STATUS_DONE
+    except Exception as e:
+        job.error = str(e)
+        job.status = STATUS_FAILED
+    finally:
+        job.finished_at = time.time()
+
+def submit_sections(study_id, work_title, author, work_type, sections, use_cache=True, stream=False,
+                    priority=rate_limiter.PRIORITY_BULK, session_id=None, max_workers=4, table_of_contents=None, parts=False, save=True):
+    """
+    Encola la generación de las secciones indicadas (lista de (número, título)) y retorna el trabajo.
+    Cada sección terminada se guarda en study_store con study_id. Con stream=True el texto
+    parcial se puede consultar mientras se genera. table_of_contents es la lista completa de
+    secciones ({'number', 'title'}) del estudio. Con parts=True cada sección se genera en el
+    modo por apartados de content_generation.generate_section_drafted. Con save=False no se
+    guarda nada hasta que se llame a Job.start_saving.
+    """
+    job = Job(study_id, list(sections), use_cache, stream, priority, session_id, max_workers, table_of_contents, parts, save)
+    with _lock:
+        _prune(time.time())
+        _jobs[job.id] = job
+    _get_executor(priority).submit(_run, job, work_title, author, work_type)
+    return job
+
+def get_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+def active_jobs(study_id=None):
+    with _lock:
+        return [job for job in _jobs.values() if job.is_active() and (study_id is None or job.study_id == study_id)]
+
+def busy_sections(study_id):
+    """
+    Números de sección que algún trabajo activo del estudio está generando o tiene en cola.
+    """
+    return {number for job in active_jobs(study_id) for number in job.section_numbers}
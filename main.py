@@ -1,9 +1,14 @@
+import functools
 import streamlit as st
-import requests
-import markdown
-from bs4 import BeautifulSoup
-from docx import Document
-from io import BytesIO
+
+import completion_cache
+import instrumentation
+from catalogue import default_catalogue
+import job_runner
+import rate_limiter
+from references import extract_references, strip_references
+import study_store
+from study_document import StudyDocument
 
 # Configuración de la página
 st.set_page_config(
@@ -23,235 +28,149 @@ Finalmente, puedes exportar el estudio a un archivo en formato Word, ya sea comp
 """)
 
 # Inicialización de variables en el estado de la sesión
-if 'title' not in st.session_state:
-    st.session_state.title = ""
-if 'description' not in st.session_state:
-    st.session_state.description = ""
-if 'table_of_contents' not in st.session_state:
-    st.session_state.table_of_contents = []
-if 'sections' not in st.session_state:
-    st.session_state.sections = []  # Lista de diccionarios: [{'number': 1, 'title': 'Título', 'content': 'Contenido'}, ...]
+if 'document' not in st.session_state:
+    st.session_state.document = StudyDocument()  # Título, descripción, secciones y referencias del estudio
 if 'current_section' not in st.session_state:
     st.session_state.current_section = 1
 if 'total_sections' not in st.session_state:
     st.session_state.total_sections = 10  # Total de secciones, ajustable según necesidades
-if 'markdown_content' not in st.session_state:
-    st.session_state.markdown_content = ""
 if 'generation_complete' not in st.session_state:
     st.session_state.generation_complete = False
 if 'selected_section' not in st.session_state:
     st.session_state.selected_section = None
-if 'references' not in st.session_state:
-    st.session_state.references = []  # Lista de referencias académicas
 if 'work_type' not in st.session_state:
     st.session_state.work_type = ""  # Tipo de obra: literaria, filosófica, política, etc.
+if 'max_workers' not in st.session_state:
+    st.session_state.max_workers = 4  # Número de secciones que se generan en paralelo en el modo por lotes
+if 'section_parts' not in st.session_state:
+    st.session_state.section_parts = False  # Redactar cada sección en apartados paralelos que luego se unen
+if 'study_id' not in st.session_state:
+    st.session_state.study_id = None  # Identificador del estudio en el almacén (también en la URL como ?study=)
+if 'work_title' not in st.session_state:
+    st.session_state.work_title = ""  # Título de la obra con el que se creó el estudio
+if 'author' not in st.session_state:
+    st.session_state.author = ""  # Autor de la obra, si se conoce por el catálogo
+if 'jobs' not in st.session_state:
+    st.session_state.jobs = []  # Identificadores de los trabajos de generación en segundo plano de esta sesión
+if 'job_messages' not in st.session_state:
+    st.session_state.job_messages = []  # Avisos de trabajos terminados con errores, pendientes de mostrar
+
+JOB_POLL_SECONDS = 1.0  # Frecuencia con la que la interfaz consulta los trabajos en curso
+
+# Restaurar el estudio indicado en la URL (tras recargar la página o reiniciar el servidor)
+requested_study = st.query_params.get("study")
+if requested_study and requested_study != st.session_state.study_id:
+    restored_document, restored_info = study_store.load_study(requested_study)
+    if restored_document is not None:
+        st.session_state.document = restored_document
+        st.session_state.study_id = requested_study
+        st.session_state.work_title = restored_info['work_title']
+        st.session_state.work_type = restored_info['work_type']
+        st.session_state.author = restored_info['author']
+        st.session_state.total_sections = len(restored_document.sections) or st.session_state.total_sections
+        st.session_state.current_section = next(
+            (sec['number'] for sec in restored_document.pending_sections()),
+            st.session_state.total_sections + 1
+        )
+        st.session_state.generation_complete = restored_document.is_complete()
+        st.session_state.selected_section = None
+    else:
+        st.warning("No se encontró el estudio indicado en la URL.")
+        del st.query_params["study"]
 
 # Función para reiniciar el estado de la sesión
 def reset_session():
-    st.session_state.title = ""
-    st.session_state.description = ""
-    st.session_state.table_of_contents = []
-    st.session_state.sections = []
+    st.session_state.document = StudyDocument()
     st.session_state.current_section = 1
-    st.session_state.markdown_content = ""
     st.session_state.generation_complete = False
     st.session_state.selected_section = None
-    st.session_state.references = []
     st.session_state.work_type = ""
+    # El estudio anterior queda guardado; solo se deja de seguir en esta sesión
+    for job_id in st.session_state.jobs:
+        job = job_runner.get_job(job_id)
+        if job is not None:
+            job.cancel()
+    st.session_state.jobs = []
+    st.session_state.job_messages = []
+    st.session_state.study_id = None
+    st.session_state.work_title = ""
+    st.session_state.author = ""
+    if "study" in st.query_params:
+        del st.query_params["study"]
 
-# Función para llamar a la API de OpenRouter
-def call_openrouter_api(messages, model="qwen/qwen-2.5-72b-instruct"):
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {st.secrets['OPENROUTER_API_KEY']}"
-    }
-    data = {
-        "model": model,
-        "messages": messages
-    }
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()['choices'][0]['message']['content'].strip()
-    except requests.exceptions.HTTPError as err:
-        st.error(f"Error en la API: {err}")
-        return None
-    except Exception as e:
-        st.error(f"Error inesperado: {e}")
-        return None
-
-# Función para generar título y descripción
-def generate_title_description(work_title, work_type):
-    prompt = f"""Genera un título y una descripción para un estudio detallado de la siguiente obra clásica. El estudio debe ser educativo, claro y profesional.
-    
-Título de la obra: {work_title}
-Tipo de obra: {work_type}
-    
-Formato de respuesta:
-Título del Estudio: [Título del estudio]
-Descripción: [Descripción del estudio]
-"""
-    messages = [
-        {"role": "user", "content": prompt}
-    ]
-    response = call_openrouter_api(messages)
-    if response:
-        # Separar el título y la descripción
-        lines = response.split('\n')
-        title = ""
-        description = ""
-        for line in lines:
-            if line.startswith("Título del Estudio:"):
-                title = line.replace("Título del Estudio:", "").strip()
-            elif line.startswith("Descripción:"):
-                description = line.replace("Descripción:", "").strip()
-        return title, description
-    return None, None
-
-# Función para generar la tabla de contenidos
-def generate_table_of_contents(work_title, work_type, total_sections):
-    prompt = f"""Genera una tabla de contenidos para un estudio detallado de la siguiente obra clásica. La tabla debe contener {total_sections} secciones con títulos descriptivos y relevantes, adaptados al tipo de obra.
-    
-Título de la obra: {work_title}
-Tipo de obra: {work_type}
-    
-Formato de respuesta:
-Sección 1: [Título de la Sección 1]
-Sección 2: [Título de la Sección 2]
-...
-Sección {total_sections}: [Título de la Sección {total_sections}]
-"""
-    messages = [
-        {"role": "user", "content": prompt}
-    ]
-    response = call_openrouter_api(messages)
-    if response:
-        table = []
-        for line in response.split('\n'):
-            if line.startswith("Sección"):
-                parts = line.split(":")
-                if len(parts) >= 2:
-                    sec_num = int(parts[0].split(" ")[1])
-                    sec_title = parts[1].strip()
-                    table.append({"number": sec_num, "title": sec_title, "content": "", "references": []})
-        return table
-    return None
-
-# Función para generar un título de sección
-def generate_section_title(work_title, work_type, section_num):
-    prompt = f"""Genera un título único y descriptivo para la sección {section_num} de un estudio detallado de la siguiente obra clásica.
-    
-Título de la obra: {work_title}
-Tipo de obra: {work_type}
-    
-Formato de respuesta:
-Título de la Sección {section_num}: [Título Único]
-"""
-    messages = [
-        {"role": "user", "content": prompt}
-    ]
-    response = call_openrouter_api(messages)
-    if response:
-        title = ""
-        for line in response.split('\n'):
-            if line.startswith(f"Título de la Sección {section_num}:"):
-                title = line.replace(f"Título de la Sección {section_num}:", "").strip()
-                break
-        return title
-    return None
-
-# Función para generar una sección con análisis detallado
-def generate_section(work_title, work_type, section_num):
-    # Definir el tipo de análisis según el tipo de obra
-    if work_type.lower() == "literaria":
-        analysis_prompt = f"""Escribe el contenido de la sección {section_num} para un estudio detallado de la obra "{work_title}".
-        
-Tipo de obra: Literatura
-        
-La sección debe incluir análisis de personajes, técnicas narrativas, contexto histórico, biografía del autor y cualquier otro análisis relevante.
-        
-El contenido debe ser claro, educativo y bien estructurado, con aproximadamente 3000 tokens. Incluye referencias académicas pertinentes al final de la sección en formato APA.
-"""
-    elif work_type.lower() == "filosófica":
-        analysis_prompt = f"""Escribe el contenido de la sección {section_num} para un estudio detallado de la obra "{work_title}".
-        
-Tipo de obra: Filosofía
-        
-La sección debe incluir estudio del autor, contexto histórico, ideas principales, discusiones académicas en torno a las ideas presentadas y cualquier otro análisis relevante.
-        
-El contenido debe ser claro, educativo y bien estructurado, con aproximadamente 3000 tokens. Incluye referencias académicas pertinentes al final de la sección en formato APA.
-"""
-    elif work_type.lower() == "política":
-        analysis_prompt = f"""Escribe el contenido de la sección {section_num} para un estudio detallado de la obra "{work_title}".
-        
-Tipo de obra: Política
-        
-La sección debe incluir estudio del autor, contexto histórico, teorías políticas presentadas, impacto en la sociedad, discusiones académicas y cualquier otro análisis relevante.
-        
-El contenido debe ser claro, educativo y bien estructurado, con aproximadamente 3000 tokens. Incluye referencias académicas pertinentes al final de la sección en formato APA.
-"""
-    else:
-        analysis_prompt = f"""Escribe el contenido de la sección {section_num} para un estudio detallado de la obra "{work_title}".
-        
-Tipo de obra: {work_type}
-        
-La sección debe incluir análisis detallado relevante al tipo de obra, estructurado de manera clara y educativa, con aproximadamente 3000 tokens. Incluye referencias académicas pertinentes al final de la sección en formato APA.
-"""
-    
-    messages = [
-        {"role": "user", "content": analysis_prompt}
-    ]
-    response = call_openrouter_api(messages)
-    return response
-
-# Función para extraer referencias del contenido generado
-def extract_references(section_content):
-    # Asumiendo que las referencias están al final del contenido después de una sección llamada "Referencias"
-    references = []
-    if "Referencias" in section_content:
-        ref_section = section_content.split("Referencias")[-1]
-        for line in ref_section.split('\n'):
-            line = line.strip()
-            if line and (line.lower().startswith("apa") is False):  # Excluir posibles indicaciones de formato
-                references.append(line)
-    return references
-
-# Función para exportar a Word
-def export_to_word(markdown_content, references):
-    # Convertir Markdown a HTML
-    html = markdown.markdown(markdown_content)
-    
-    # Parsear HTML con BeautifulSoup
-    soup = BeautifulSoup(html, 'html.parser')
-    
-    # Crear un documento de Word
-    doc = Document()
-    
-    # Iterar sobre los elementos del HTML y agregarlos al documento
-    for element in soup.descendants:
-        if isinstance(element, str):
-            continue  # Ignorar cadenas de texto directas
-        if element.name == 'h1':
-            doc.add_heading(element.get_text(), level=1)
-        elif element.name == 'h2':
-            doc.add_heading(element.get_text(), level=2)
-        elif element.name == 'h3':
-            doc.add_heading(element.get_text(), level=3)
-        elif element.name == 'p':
-            doc.add_paragraph(element.get_text())
-    
-    # Agregar sección de Referencias si existen
-    if references:
-        doc.add_heading("Referencias", level=2)
-        for ref in references:
-            doc.add_paragraph(ref, style='List Number')
-    
-    # Guardar el documento en un objeto BytesIO
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
+# Función para incorporar al documento las secciones terminadas por los trabajos en segundo plano
+def apply_job_results():
+    """
+    Copia al documento de la sesión las secciones que terminaron desde la última consulta y
+    olvida los trabajos finalizados. Retorna True si cambió algo que requiere redibujar la página.
+    """
+    document = st.session_state.document
+    changed = False
+    for job_id in list(st.session_state.jobs):
+        job = job_runner.get_job(job_id)
+        finished = job is None or not job.is_active()
+        if job is not None and job.study_id == st.session_state.study_id:
+            for record in job.take_completed():
+                document.update_section(record['number'], title=record['title'], content_id=record['content_id'], references=record['references'])
+                changed = True
+        if finished:
+            st.session_state.jobs.remove(job_id)
+            if job is not None and (job.failed or job.error):
+                failed = ", ".join(str(num) for num in sorted(job.failed))
+                st.session_state.job_messages.append(f"No se pudieron generar las secciones: {failed or job.error}")
+            changed = True
+    if changed:
+        # Avanzar el puntero a la primera sección que siga pendiente
+        st.session_state.current_section = next(
+            (sec['number'] for sec in document.pending_sections()),
+            st.session_state.total_sections + 1
+        )
+        st.session_state.generation_complete = document.is_complete()
+    return changed
+
+# Función para encolar la generación de secciones en segundo plano
+def submit_generation(sections, use_cache=True, stream=False, priority=rate_limiter.PRIORITY_BULK):
+    job = job_runner.submit_sections(
+        st.session_state.study_id,
+        st.session_state.work_title,
+        st.session_state.author,
+        st.session_state.work_type,
+        sections,
+        use_cache=use_cache,
+        stream=stream,
+        priority=priority,
+        session_id=rate_limiter.current_session_id(),
+        max_workers=st.session_state.max_workers,
+        table_of_contents=[{"number": sec['number'], "title": sec['title']} for sec in st.session_state.document.sections],
+        parts=st.session_state.section_parts
+    )
+    st.session_state.jobs.append(job.id)
+    return job
+
+# Función que muestra el avance de los trabajos; se vuelve a ejecutar sola mientras haya trabajos en curso
+def show_job_progress():
+    if apply_job_results():
+        st.rerun()  # Redibujar toda la página con las secciones nuevas
+    for job_id in st.session_state.jobs:
+        job = job_runner.get_job(job_id)
+        if job is None:
+            continue
+        numbers = ", ".join(str(num) for num in job.section_numbers)
+        st.info(f"Generando en segundo plano la(s) sección(es) {numbers}: {len(job.completed)}/{len(job.sections)} terminadas ({job.status}).")
+        if job.stream:
+            for number in job.section_numbers:
+                partial_text = job.partial_text(number)
+                if partial_text:
+                    st.markdown(partial_text)
+        st.button("Cancelar", key=f"cancel_{job.id}", on_click=job.cancel)
+
+# Función para exportar el estudio a Word; se ejecuta solo al pulsar el botón de descarga
+def build_word_export(document, partial=False):
+    # python-docx y markdown-it se importan solo la primera vez que se descarga un documento
+    from utils import export_to_word_cached
+    # Las referencias las agrega export_to_word al final del documento
+    markdown_content = document.to_markdown(partial=partial, include_references=False)
+    return export_to_word_cached(markdown_content, document.references)
 
 # --- Barra Lateral ---
 with st.sidebar:
@@ -265,55 +184,158 @@ with st.sidebar:
     st.markdown("---")
     
     # Menú desplegable para ver secciones generadas
-    if st.session_state.sections:
+    if st.session_state.document.sections:
         selected_section = st.selectbox(
             "Selecciona una sección para ver:",
-            [f"Sección {sec['number']}" for sec in st.session_state.sections],
+            [f"Sección {sec['number']}" for sec in st.session_state.document.sections],
             key="select_section"
         )
         section_index = int(selected_section.split(" ")[1]) - 1
         # Verificar que el índice esté dentro del rango
-        if 0 <= section_index < len(st.session_state.sections):
+        if 0 <= section_index < len(st.session_state.document.sections):
             st.session_state.selected_section = section_index
         else:
             st.error("Sección seleccionada no válida.")
     else:
         st.info("No hay secciones generadas aún.")
 
+    st.markdown("---")
+
+    # Número de secciones que se generan simultáneamente en el modo por lotes
+    st.session_state.max_workers = st.slider(
+        "Secciones generadas en paralelo:",
+        min_value=1,
+        max_value=10,
+        value=st.session_state.max_workers
+    )
+
+    # Modo por apartados: menos espera por sección a cambio de una llamada corta más para unirlos
+    st.session_state.section_parts = st.checkbox(
+        "Redactar cada sección por apartados en paralelo",
+        value=st.session_state.section_parts
+    )
+
+    # Contadores del caché de respuestas del modelo
+    cache_stats = completion_cache.get_stats()
+    st.caption(f"Caché de respuestas: {cache_stats['hits']} aciertos, {cache_stats['misses']} fallos")
+
+    # Latencia, tokens y coste de las llamadas a OpenRouter y Open Library de este proceso
+    with st.expander("Métricas de las llamadas"):
+        events = instrumentation.recent_events()
+        if events:
+            st.dataframe(instrumentation.summarize(events), hide_index=True)
+            # Reparto de las llamadas entre los modelos de cada paso (incluidas las de respaldo)
+            from model_router import route_metrics
+            st.dataframe(route_metrics(events), hide_index=True)
+            study_totals = instrumentation.tokens_by_study(events).get(st.session_state.study_id)
+            if study_totals:
+                st.caption(
+                    f"Este estudio: {study_totals['llamadas']} llamadas, {study_totals['tokens']} tokens, "
+                    f"{study_totals['segundos']:.1f} s de generación, coste {study_totals['coste']:.4f}"
+                )
+            import hedging
+            if hedging.ENABLED:
+                hedge_stats = hedging.default_policy.get_stats()
+                st.caption(
+                    f"Peticiones duplicadas: {hedge_stats['hedges']} de {hedge_stats['requests']} "
+                    f"({hedge_stats['hedge_wins']} ganaron, {hedge_stats['declined']} sin presupuesto)"
+                )
+            st.caption(f"Trazas completas en {instrumentation.TRACE_PATH}")
+        else:
+            st.caption("Aún no hay llamadas registradas.")
+
 # --- Sección Principal ---
 
+# Incorporar las secciones que terminaron en segundo plano desde la última ejecución
+apply_job_results()
+document = st.session_state.document
+
 # Entrada de usuario para el título de la obra
-work_title = st.text_input("Ingresa el título de la obra clásica:", "")
+work_title = st.text_input("Ingresa el título de la obra clásica:", st.session_state.work_title)
+
+# Sugerencias del catálogo (sin acentos ni mayúsculas y tolerantes a errores de escritura)
+catalogue_author = ""
+if work_title:
+    catalogue_entry = default_catalogue().lookup(work_title)
+    if catalogue_entry:
+        st.caption(f"Obra del catálogo: {catalogue_entry['title']} ({catalogue_entry['author']})")
+        catalogue_author = catalogue_entry['author']
+    else:
+        suggestions = default_catalogue().suggest(work_title, limit=5)
+        if suggestions:
+            suggestion_labels = {f"{entry['title']} ({entry['author']})": entry for entry in suggestions}
+            typed_option = "Usar el título tal como se escribió"
+            suggestion_choice = st.selectbox("Obras del catálogo que coinciden:", [typed_option] + list(suggestion_labels))
+            if suggestion_choice != typed_option:
+                work_title = suggestion_labels[suggestion_choice]['title']
+                catalogue_author = suggestion_labels[suggestion_choice]['author']
 
 # Selección del tipo de obra
+work_types = ["Literaria", "Filosófica", "Política", "Otro"]
 work_type = st.selectbox(
     "Selecciona el tipo de obra:",
-    ["Literaria", "Filosófica", "Política", "Otro"],
-    index=0
+    work_types,
+    index=work_types.index(st.session_state.work_type) if st.session_state.work_type in work_types else 0
 )
 
 # Botón para generar título, descripción y tabla de contenidos
-if not st.session_state.title:
+if not document.title:
     if st.button("Generar Título, Descripción y Tabla de Contenidos"):
         if not work_title:
             st.warning("Por favor, ingresa el título de la obra para generar el estudio.")
         else:
             with st.spinner("Generando título, descripción y tabla de contenidos..."):
-                title, description = generate_title_description(work_title, work_type)
+                # content_generation (y requests) se cargan con la primera generación, no al arrancar
+                from content_generation import bootstrap_study
+                new_study_id = study_store.new_study_id()
+                speculative_jobs = []
+
+                # La primera sección empieza en cuanto llega la tabla de contenidos, sin esperar al título.
+                # No se guarda en study_store hasta que exista el estudio (Job.start_saving)
+                def start_first_section(table_of_contents):
+                    first_section = table_of_contents[0]
+                    speculative_jobs.append(job_runner.submit_sections(
+                        new_study_id, work_title, catalogue_author, work_type,
+                        [(first_section['number'], first_section['title'])],
+                        stream=True,
+                        priority=rate_limiter.PRIORITY_INTERACTIVE,
+                        session_id=rate_limiter.current_session_id(),
+                        table_of_contents=[{"number": sec['number'], "title": sec['title']} for sec in table_of_contents],
+                        parts=st.session_state.section_parts,
+                        save=False
+                    ))
+
+                with instrumentation.study(new_study_id):
+                    bootstrap = bootstrap_study(
+                        work_title, catalogue_author, work_type, st.session_state.total_sections,
+                        on_table_of_contents=start_first_section
+                    )
+                title, description = bootstrap['title'], bootstrap['description']
+                table_of_contents = bootstrap['table_of_contents']
+                if not (title and description and table_of_contents) or bootstrap['author'] != catalogue_author:
+                    # Sin estudio no se aprovecha la sección especulativa; tampoco si Open Library aportó
+                    # el autor, porque el resto de secciones se generarán con otro prefijo en el prompt
+                    for job in speculative_jobs:
+                        job.cancel()
+                    speculative_jobs = []
                 if title and description:
-                    table_of_contents = generate_table_of_contents(work_title, work_type, st.session_state.total_sections)
                     if table_of_contents:
-                        st.session_state.title = title
-                        st.session_state.description = description
-                        st.session_state.table_of_contents = table_of_contents
-                        # Construir el contenido Markdown
-                        st.session_state.markdown_content = f"# {title}\n\n{description}\n\n## Tabla de Contenidos\n\n"
-                        for sec in table_of_contents:
-                            st.session_state.markdown_content += f"{sec['number']}. {sec['title']}\n"
-                        st.session_state.markdown_content += "\n"
-                        # Inicializar la lista de secciones sin contenido
-                        st.session_state.sections = [{"number": sec['number'], "title": sec['title'], "content": "", "references": []} for sec in table_of_contents]
+                        # Inicializar el documento con las secciones sin contenido
+                        document.set_header(title, description)
+                        document.set_table_of_contents(table_of_contents)
+                        # Guardar el estudio y enlazarlo desde la URL para poder retomarlo
+                        st.session_state.study_id = new_study_id
+                        st.session_state.work_title = work_title
+                        st.session_state.work_type = work_type
+                        st.session_state.author = bootstrap['author']
+                        study_store.save_study(st.session_state.study_id, document, work_title, bootstrap['author'], work_type)
+                        for job in speculative_jobs:
+                            job.start_saving()
+                        st.session_state.jobs.extend(job.id for job in speculative_jobs)
+                        st.query_params["study"] = st.session_state.study_id
                         st.success("Título, descripción y tabla de contenidos generados exitosamente.")
+                        if bootstrap['work']:
+                            st.caption(f"Open Library: {bootstrap['work'].get('title', work_title)} ({bootstrap['author'] or 'autor no disponible'})")
                         st.subheader("Título")
                         st.write(title)
                         st.subheader("Descripción")
@@ -328,213 +350,109 @@ else:
     st.info("El título, descripción y tabla de contenidos ya han sido generados. Si deseas generar nuevamente, reinicia la generación.")
 
 # Permitir edición de la información inicial si ya se ha generado
-if st.session_state.title and st.session_state.description and st.session_state.table_of_contents:
+if document.title and document.description and document.sections:
     st.markdown("---")
     st.header("Editar Información Inicial")
     
     with st.form("edit_initial_info"):
         # Editar Título del Estudio
-        edited_title = st.text_input("Título del Estudio:", st.session_state.title)
+        edited_title = st.text_input("Título del Estudio:", document.title)
         
         # Editar Descripción del Estudio
-        edited_description = st.text_area("Descripción del Estudio:", st.session_state.description, height=200)
+        edited_description = st.text_area("Descripción del Estudio:", document.description, height=200)
         
         # Editar Tabla de Contenidos
         st.subheader("Tabla de Contenidos")
-        edited_table = []
-        for sec in st.session_state.sections:
-            edited_title_sec = st.text_input(f"Sección {sec['number']}:", sec['title'], key=f"sec_{sec['number']}")
-            edited_table.append({"number": sec['number'], "title": edited_title_sec, "content": sec['content'], "references": sec['references']})
+        edited_titles = {}
+        for sec in document.sections:
+            edited_titles[sec['number']] = st.text_input(f"Sección {sec['number']}:", sec['title'], key=f"sec_{sec['number']}")
         
         submit_edit = st.form_submit_button("Guardar Cambios")
         
         if submit_edit:
-            st.session_state.title = edited_title
-            st.session_state.description = edited_description
-            st.session_state.table_of_contents = edited_table
-            st.session_state.sections = edited_table
-            # Reconstruir el contenido Markdown
-            st.session_state.markdown_content = f"# {st.session_state.title}\n\n{st.session_state.description}\n\n## Tabla de Contenidos\n\n"
-            for sec in st.session_state.table_of_contents:
-                st.session_state.markdown_content += f"{sec['number']}. {sec['title']}\n"
-            st.session_state.markdown_content += "\n"
+            document.set_header(edited_title, edited_description)
+            # Solo cambia el título de las secciones editadas; su texto en content_store no se toca
+            for sec_num, edited_title_sec in edited_titles.items():
+                if edited_title_sec != document.get_section(sec_num)['title']:
+                    document.update_section(sec_num, title=edited_title_sec)
+            if st.session_state.study_id:
+                study_store.save_study(st.session_state.study_id, document, st.session_state.work_title, st.session_state.author, st.session_state.work_type)
             st.success("Información inicial actualizada exitosamente.")
 
 # Mostrar la sección para generar análisis solo si el título, descripción y tabla de contenidos han sido generados
-if st.session_state.title and st.session_state.description and st.session_state.table_of_contents:
+if document.title and document.description and document.sections:
     st.markdown("---")
     st.header("Generación de Secciones de Análisis")
 
     # Barra de progreso
-    generated_sections = len([sec for sec in st.session_state.sections if sec['content']])
-    progress = generated_sections / st.session_state.total_sections
-    progress_bar = st.progress(progress)
+    st.progress(len(document.generated_sections()) / st.session_state.total_sections)
+    busy_sections = job_runner.busy_sections(st.session_state.study_id)  # Secciones que ya se están generando
 
     # Botón para regenerar la sección seleccionada
     if st.session_state.selected_section is not None:
         with st.container():
-            section = st.session_state.sections[st.session_state.selected_section]
+            section = document.sections[st.session_state.selected_section]
             if section['title']:
                 st.subheader(f"Sección {section['number']}: {section['title']}")
             else:
                 st.subheader(f"Sección {section['number']}")
-            if section['content']:
-                # Mostrar contenido de la sección sin las referencias para evitar redundancia
-                if "Referencias" in section['content']:
-                    main_content, ref_content = section['content'].split("Referencias", 1)
-                    st.markdown(main_content)
+            section_content = document.section_content(section['number'])
+            if section_content:
+                # Mostrar contenido de la sección sin el apartado final de referencias para evitar redundancia
+                st.markdown(strip_references(section_content))
+                section_references = extract_references(section_content) or section['references']
+                if section_references:
                     with st.expander("Ver Referencias"):
-                        st.markdown(ref_content)
-                else:
-                    st.markdown(section['content'])
+                        st.markdown("\n".join(f"- {ref}" for ref in section_references))
             else:
                 st.info("Esta sección aún no ha sido generada.")
-            if st.button("Regenerar Sección"):
-                with st.spinner(f"Regenerando sección {section['number']}..."):
-                    sec_num = section['number']
-                    # Generar un nuevo título para la sección si es necesario
-                    new_title = generate_section_title(work_title, work_type, sec_num)
-                    if not new_title:
-                        st.error(f"No se pudo generar el título para la sección {sec_num}.")
-                    else:
-                        # Generar contenido para la sección
-                        new_content = generate_section(work_title, work_type, sec_num)
-                        if new_content:
-                            # Extraer referencias del nuevo contenido
-                            new_references = extract_references(new_content)
-                            # Actualizar la sección con el nuevo título, contenido y referencias
-                            st.session_state.sections[st.session_state.selected_section]['title'] = new_title
-                            st.session_state.sections[st.session_state.selected_section]['content'] = new_content
-                            st.session_state.sections[st.session_state.selected_section]['references'] = new_references
-                            
-                            # Agregar referencias al estado global de referencias si no están duplicadas
-                            for ref in new_references:
-                                if ref not in st.session_state.references:
-                                    st.session_state.references.append(ref)
-                            
-                            # Actualizar el contenido Markdown
-                            if "Referencias" in section['content']:
-                                chapter_heading_old = f"## Sección {sec_num}: " + (section['title'] if section['title'] else f"Sección {sec_num}") + "\n\n"
-                                chapter_main_old, _ = section['content'].split("Referencias", 1)
-                            else:
-                                chapter_heading_old = f"## Sección {sec_num}: " + (section['title'] if section['title'] else f"Sección {sec_num}") + "\n\n"
-                                chapter_main_old = section['content']
-                            
-                            chapter_heading_new = f"## Sección {sec_num}: {new_title}\n\n"
-                            chapter_content_new = new_content + "\n\n"
-                            
-                            # Reemplazar en markdown_content
-                            st.session_state.markdown_content = st.session_state.markdown_content.replace(
-                                chapter_heading_old + chapter_main_old,
-                                chapter_heading_new + chapter_content_new
-                            )
-                            
-                            st.success(f"Sección {sec_num} regenerada exitosamente.")
-                            # Actualizar la barra de progreso si la sección antes no tenía contenido
-                            if not section['content']:
-                                generated_sections += 1
-                                progress = generated_sections / st.session_state.total_sections
-                                progress_bar.progress(progress)
-                        else:
-                            st.error(f"No se pudo generar el contenido para la sección {sec_num}.")
+            sec_num = section['number']
+            if st.button("Regenerar Sección", disabled=sec_num in busy_sections):
+                # Se regenera en segundo plano, mostrando el texto a medida que se recibe
+                submit_generation([(sec_num, section['title'])], use_cache=False, stream=True, priority=rate_limiter.PRIORITY_INTERACTIVE)
 
     # Botón para generar la siguiente sección
     if st.session_state.current_section <= st.session_state.total_sections:
-        if st.button("Generar Siguiente Sección"):
-            with st.spinner(f"Generando sección {st.session_state.current_section}..."):
-                section = st.session_state.sections[st.session_state.current_section - 1]
-                if not section['content']:
-                    # Generar título para la sección
-                    generated_title = generate_section_title(work_title, work_type, st.session_state.current_section)
-                    if not generated_title:
-                        st.error(f"No se pudo generar el título para la sección {st.session_state.current_section}.")
-                    else:
-                        # Generar contenido para la sección
-                        generated_content = generate_section(work_title, work_type, st.session_state.current_section)
-                        if generated_content:
-                            # Extraer referencias del contenido generado
-                            generated_references = extract_references(generated_content)
-                            # Actualizar la sección con título, contenido y referencias
-                            st.session_state.sections[st.session_state.current_section - 1]['title'] = generated_title
-                            st.session_state.sections[st.session_state.current_section - 1]['content'] = generated_content
-                            st.session_state.sections[st.session_state.current_section - 1]['references'] = generated_references
-                            
-                            # Agregar referencias al estado global de referencias si no están duplicadas
-                            for ref in generated_references:
-                                if ref not in st.session_state.references:
-                                    st.session_state.references.append(ref)
-                            
-                            # Agregar al contenido Markdown
-                            section_heading = f"## Sección {st.session_state.current_section}: {generated_title}\n\n"
-                            section_content = generated_content + "\n\n"
-                            st.session_state.markdown_content += f"{section_heading}{section_content}"
-                            
-                            st.success(f"Sección {st.session_state.current_section} generada exitosamente.")
-                            st.session_state.current_section += 1
-                            
-                            # Actualizar la barra de progreso
-                            generated_sections += 1
-                            progress = generated_sections / st.session_state.total_sections
-                            progress_bar.progress(progress)
-                        else:
-                            st.error(f"No se pudo generar el contenido para la sección {st.session_state.current_section}.")
-                else:
-                    st.info(f"La sección {st.session_state.current_section} ya ha sido generada.")
-
-    # Actualizar la barra de progreso hasta completar
-    if len([sec for sec in st.session_state.sections if sec['content']]) == st.session_state.total_sections:
-        st.session_state.generation_complete = True
-
-    # Botones para exportar a Word
-    if st.session_state.sections:
-        with st.spinner("Preparando la exportación..."):
-            # Exportar contenido parcial
-            partial_markdown = f"# {st.session_state.title}\n\n{st.session_state.description}\n\n## Tabla de Contenidos\n\n"
-            for sec in st.session_state.sections:
-                if sec['content']:
-                    partial_markdown += f"{sec['number']}. {sec['title']}\n"
-            partial_markdown += "\n"
-            for sec in st.session_state.sections:
-                if sec['content']:
-                    partial_markdown += f"## Sección {sec['number']}: {sec['title']}\n\n{sec['content']}\n\n"
-                else:
-                    break  # Solo incluir secciones generadas hasta el momento
-            # Agregar referencias al final si hay
-            if st.session_state.references:
-                partial_markdown += "## Referencias\n\n"
-                for ref in st.session_state.references:
-                    partial_markdown += f"{ref}\n"
-            partial_word_file = export_to_word(partial_markdown, st.session_state.references)
-            
-            # Exportar contenido completo
-            if st.session_state.generation_complete:
-                complete_markdown = st.session_state.markdown_content
-                # Agregar todas las referencias al final
-                complete_markdown += "\n## Referencias\n\n"
-                for ref in st.session_state.references:
-                    complete_markdown += f"{ref}\n"
-                complete_word_file = export_to_word(complete_markdown, st.session_state.references)
-                st.success("Preparado para descargar el estudio completo.")
+        next_section = document.get_section(st.session_state.current_section)
+        if st.button("Generar Siguiente Sección", disabled=next_section['number'] in busy_sections):
+            if not next_section['content_id']:
+                submit_generation([(next_section['number'], next_section['title'])], stream=True, priority=rate_limiter.PRIORITY_INTERACTIVE)
             else:
-                complete_word_file = None
+                st.info(f"La sección {next_section['number']} ya ha sido generada.")
+
+    # Botón para generar todas las secciones pendientes en paralelo
+    pending_sections = [sec for sec in document.pending_sections() if sec['number'] not in busy_sections]
+    if pending_sections:
+        if st.button("Generar Todas las Secciones"):
+            submit_generation([(sec['number'], sec['title']) for sec in pending_sections])
+
+    # Avance de los trabajos en segundo plano; mientras tanto se pueden consultar las demás secciones
+    if st.session_state.jobs:
+        st.fragment(run_every=JOB_POLL_SECONDS)(show_job_progress)()
+    for message in st.session_state.job_messages:
+        st.error(message)
+    st.session_state.job_messages = []
 
-            # Botón para descargar contenido parcial en Word
+    # Botones para exportar a Word: el .docx se construye solo cuando se pide la descarga
+    if document.sections:
+        # Botón para descargar contenido parcial en Word
+        st.download_button(
+            label="Descargar Contenido Parcial en Word",
+            data=functools.partial(build_word_export, document, partial=True),
+            file_name=f"{document.title.replace(' ', '_')}_Parcial.docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
+        
+        # Botón para descargar contenido completo en Word (solo si está completo)
+        if st.session_state.generation_complete:
+            st.success("Preparado para descargar el estudio completo.")
             st.download_button(
-                label="Descargar Contenido Parcial en Word",
-                data=partial_word_file,
-                file_name=f"{st.session_state.title.replace(' ', '_')}_Parcial.docx",
+                label="Descargar Estudio Completo en Word",
+                data=functools.partial(build_word_export, document),
+                file_name=f"{document.title.replace(' ', '_')}.docx",
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
             )
-            
-            # Botón para descargar contenido completo en Word (solo si está completo)
-            if st.session_state.generation_complete:
-                st.download_button(
-                    label="Descargar Estudio Completo en Word",
-                    data=complete_word_file,
-                    file_name=f"{st.session_state.title.replace(' ', '_')}.docx",
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                )
 
-    # Opcional: Mostrar todo el contenido generado
-    with st.expander("Mostrar Contenido Completo"):
-        st.markdown(st.session_state.markdown_content)
+    # Opcional: Mostrar todo el contenido generado (el Markdown completo solo se construye si se pide)
+    if st.toggle("Mostrar Contenido Completo"):
+        st.markdown(document.to_markdown())
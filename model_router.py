@@ -0,0 +1,72 @@
+# model_router.py
+
+import json
+import os
+
+from instrumentation import percentile
+
+SMALL_MODEL = "qwen/qwen-2.5-7b-instruct"  # Rápido y barato: respuestas cortas con formato fijo
+LARGE_MODEL = "qwen/qwen-2.5-72b-instruct"  # Textos largos de análisis
+FALLBACK_MODEL = "meta-llama/llama-3.1-70b-instruct"  # Alternativa de otro proveedor si el modelo grande falla
+
+# Paso de la generación -> modelos en orden de preferencia (los siguientes se usan si el anterior falla)
+DEFAULT_ROUTES = {
+    "title_description": [SMALL_MODEL, LARGE_MODEL],
+    "table_of_contents": [SMALL_MODEL, LARGE_MODEL],
+    "section_title": [SMALL_MODEL, LARGE_MODEL],
+    "section": [LARGE_MODEL, FALLBACK_MODEL],
+    "section_retry": [LARGE_MODEL, FALLBACK_MODEL],
+    "section_part": [LARGE_MODEL, FALLBACK_MODEL],
+    "section_merge": [SMALL_MODEL, LARGE_MODEL],  # Solo introducción, transiciones y conclusión
+    "chat": [LARGE_MODEL, FALLBACK_MODEL],
+}
+
+def _load_routes():
+    """
+    Rutas por defecto, sustituidas paso a paso por las de la variable de entorno
+    OBRASCLASICAS_MODEL_ROUTES (JSON: {"paso": ["modelo", ...]}).
+    """
+    routes = {step: list(models) for step, models in DEFAULT_ROUTES.items()}
+    overrides = os.environ.get("OBRASCLASICAS_MODEL_ROUTES")
+    if overrides:
+        try:
+            routes.update({step: list(models) for step, models in json.loads(overrides).items() if models})
+        except (ValueError, AttributeError, TypeError):
+            pass  # Una configuración mal escrita no debe impedir generar
+    return routes
+
+ROUTES = _load_routes()
+
+def models_for(step):
+    """
+    Cadena de modelos para un paso; los pasos desconocidos usan la ruta "chat".
+    """
+    return list(ROUTES.get(step) or ROUTES["chat"])
+
+def route_metrics(events):
+    """
+    Métricas por paso y modelo a partir de los eventos de instrumentation: llamadas, errores,
+    llamadas de respaldo (cuando el modelo preferido falló), peticiones duplicadas por hedging,
+    latencia p50/p95, tokens y coste.
+    """
+    groups = {}
+    for event in events:
+        if event.get("service") != "openrouter" or event.get("cache") == "hit":
+            continue
+        groups.setdefault((event.get("operation"), event.get("model")), []).append(event)
+    rows = []
+    for (step, model), group in sorted(groups.items(), key=lambda item: (str(item[0][0]), str(item[0][1]))):
+        latencies = [event["wall_ms"] for event in group if not event.get("error") and not event.get("cancelled")]
+        rows.append({
+            "paso": step,
+            "modelo": model,
+            "llamadas": len(group),
+            "errores": sum(1 for event in group if event.get("error")),
+            "respaldo": sum(1 for event in group if event.get("attempt") and not event.get("hedge")),
+            "duplicadas": sum(1 for event in group if event.get("hedge")),
+            "p50 ms": percentile(latencies, 50),
+            "p95 ms": percentile(latencies, 95),
+            "tokens": sum((event.get("prompt_tokens") or 0) + (event.get("completion_tokens") or 0) for event in group),
+            "coste": round(sum(event.get("cost") or 0 for event in group), 6),
+        })
+    return rows
@@ -1,32 +1,140 @@
 # open_library.py
 
+import bisect
+import json
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import streamlit as st
 
-def search_open_library(title, author):
+import http_client
+import instrumentation
+from catalogue import default_catalogue, normalize_text
+
+OPEN_LIBRARY_SEARCH_URL = "https://openlibrary.org/search.json"
+OPEN_LIBRARY_TIMEOUT = (5, 15)  # (conexión, lectura) en segundos
+SEARCH_FIELDS = "key,title,author_name,subject,first_sentence"  # Solo los campos que usa extract_work_info
+LOOKUP_CACHE_PATH = os.environ.get("OBRASCLASICAS_OPEN_LIBRARY_CACHE_PATH", os.path.join(".cache", "open_library.sqlite3"))
+LOOKUP_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # Las búsquedas con resultado caducan a los 30 días
+LOOKUP_CACHE_MISS_TTL_SECONDS = 24 * 60 * 60  # Las búsquedas sin resultado se repiten al día siguiente
+PREFETCH_MAX_WORKERS = 3  # Peticiones simultáneas a Open Library durante la precarga
+
+def normalize_lookup_key(title, author):
+    """
+    Clave del caché para el par (título, autor), normalizados con catalogue.normalize_text.
+    """
+    return f"{normalize_text(title)}\x1f{normalize_text(author)}"
+
+def _connect_lookup_cache():
+    directory = os.path.dirname(LOOKUP_CACHE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(LOOKUP_CACHE_PATH, timeout=10)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS lookups (
+            key TEXT PRIMARY KEY,
+            work TEXT,
+            fetched_at REAL NOT NULL
+        )
+    """)
+    return conn
+
+def _read_lookup_cache(key):
+    """
+    Retorna (encontrado, obra, fecha) de la búsqueda almacenada; obra es None si no hubo resultado.
+    """
+    try:
+        conn = _connect_lookup_cache()
+        try:
+            row = conn.execute("SELECT work, fetched_at FROM lookups WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False, None, 0.0
+    if row is None:
+        return False, None, 0.0
+    return True, (json.loads(row[0]) if row[0] is not None else None), row[1]
+
+def _write_lookup_cache(key, work):
+    try:
+        conn = _connect_lookup_cache()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO lookups (key, work, fetched_at) VALUES (?, ?, ?)",
+                (key, json.dumps(work, ensure_ascii=False) if work is not None else None, time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        pass
+
+def search_open_library(title, author, use_cache=True):
     """
     Busca una obra en Open Library usando el título y el autor.
     Retorna la información de la obra si se encuentra, de lo contrario, retorna None.
+    Los resultados se guardan en un caché local; si Open Library no responde se usa
+    la copia almacenada aunque haya caducado.
     """
-    query = f"title:{title} author:{author}"
-    url = f"https://openlibrary.org/search.json?q={requests.utils.quote(query)}&limit=1"
+    key = normalize_lookup_key(title, author)
+    found, cached_work, fetched_at = _read_lookup_cache(key) if use_cache else (False, None, 0.0)
+    if found:
+        ttl = LOOKUP_CACHE_TTL_SECONDS if cached_work is not None else LOOKUP_CACHE_MISS_TTL_SECONDS
+        if time.time() - fetched_at < ttl:
+            return cached_work
+
+    query = f"title:{title} author:{author}" if author else f"title:{title}"
+    url = f"{OPEN_LIBRARY_SEARCH_URL}?q={requests.utils.quote(query)}&fields={SEARCH_FIELDS}&limit=1"
     
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data['numFound'] > 0:
-            work = data['docs'][0]
+    # "refresh": había una copia caducada y se vuelve a consultar; "stale" solo si se acaba usando
+    with instrumentation.span("open_library", "search", cache="refresh" if found else "miss") as event:
+        try:
+            response = http_client.get(url, timeout=OPEN_LIBRARY_TIMEOUT)
+            event["ttfb_ms"] = round(response.elapsed.total_seconds() * 1000, 1)
+            event["status"] = response.status_code
+            response.raise_for_status()
+            data = response.json()
+
+            if data['numFound'] > 0:
+                work = data['docs'][0]
+            else:
+                work = None
+            _write_lookup_cache(key, work)
             return work
-        else:
+        except requests.exceptions.HTTPError as err:
+            event["error"] = str(err)
+            if found:
+                event["cache"] = "stale"
+                return cached_work
+            st.error(f"Error al consultar Open Library: {err}")
+            return None
+        except Exception as e:
+            event["error"] = f"{type(e).__name__}: {e}"
+            if found:
+                event["cache"] = "stale"
+                return cached_work
+            st.error(f"Error inesperado al consultar Open Library: {e}")
             return None
-    except requests.exceptions.HTTPError as err:
-        st.error(f"Error al consultar Open Library: {err}")
-        return None
-    except Exception as e:
-        st.error(f"Error inesperado al consultar Open Library: {e}")
-        return None
+
+def prefetch_works(pairs, max_workers=PREFETCH_MAX_WORKERS):
+    """
+    Calienta el caché de búsquedas para una lista de pares (título, autor).
+    Retorna el número de obras encontradas.
+    """
+    unique_pairs = list({normalize_lookup_key(title, author): (title, author) for title, author in pairs}.values())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda pair: search_open_library(*pair), unique_pairs))
+    return sum(1 for work in results if work is not None)
+
+def prefetch_predefined_works(max_workers=PREFETCH_MAX_WORKERS):
+    """
+    Precarga las obras del catálogo predefinido (una búsqueda por obra, con su autor).
+    """
+    return prefetch_works(default_catalogue().pairs(), max_workers=max_workers)
 
 def extract_work_info(work):
     """
@@ -49,21 +157,69 @@ def extract_work_info(work):
         'work_type': work_type
     }
 
+WORK_TYPES = ("Literaria", "Filosófica", "Política")  # En caso de empate gana el primero
+WORK_TYPE_KEYWORDS = {
+    # Palabra o frase (en minúsculas): (tipo de obra, peso)
+    "novel": ("Literaria", 3), "novels": ("Literaria", 3), "fiction": ("Literaria", 3),
+    "poetry": ("Literaria", 3), "poems": ("Literaria", 3), "drama": ("Literaria", 3), "plays": ("Literaria", 2),
+    "short story": ("Literaria", 3), "short stories": ("Literaria", 3), "literature": ("Literaria", 2),
+    "novela": ("Literaria", 3), "poesía": ("Literaria", 3), "poesia": ("Literaria", 3), "literatura": ("Literaria", 2),
+    "philosophy": ("Filosófica", 3), "ethics": ("Filosófica", 3), "metaphysics": ("Filosófica", 3),
+    "ontology": ("Filosófica", 3), "epistemology": ("Filosófica", 3), "thought": ("Filosófica", 1),
+    "idea": ("Filosófica", 1), "ideas": ("Filosófica", 1), "filosofía": ("Filosófica", 3), "filosofia": ("Filosófica", 3),
+    "politics": ("Política", 3), "political theory": ("Política", 3), "political science": ("Política", 3),
+    "political": ("Política", 2), "government": ("Política", 2), "democracy": ("Política", 2),
+    "state": ("Política", 1), "society": ("Política", 1), "política": ("Política", 3), "politica": ("Política", 3),
+}
+# Una sola expresión precompilada; las frases largas van primero para que "political theory" gane a "political"
+_WORK_TYPE_PATTERN = re.compile(
+    r"\b(?:" + "|".join(re.escape(keyword) for keyword in sorted(WORK_TYPE_KEYWORDS, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+
+def score_work_type(subjects):
+    """
+    Puntuación ponderada de cada tipo de obra según los géneros (subjects) de Open Library.
+    Las palabras clave solo cuentan como palabras completas.
+    """
+    scores = dict.fromkeys(WORK_TYPES, 0)
+    for match in _WORK_TYPE_PATTERN.finditer("\n".join(subjects)):
+        work_type, weight = WORK_TYPE_KEYWORDS[match.group(0).lower()]
+        scores[work_type] += weight
+    return scores
+
+def _best_work_type(scores):
+    best = max(WORK_TYPES, key=lambda work_type: scores[work_type])
+    return best if scores[best] > 0 else "Otro"
+
 def determine_work_type_from_subjects(subjects):
     """
-    Determina el tipo de obra basado en los géneros (subjects) de Open Library.
+    Determina el tipo de obra basado en los géneros (subjects) de Open Library:
+    el tipo con mayor puntuación, o "Otro" si ninguna palabra clave aparece.
     """
-    literatura_keywords = ["novel", "poetry", "drama", "short story", "literature"]
-    filosofia_keywords = ["philosophy", "thought", "idea", "ethics", "metaphysics", "ontology"]
-    politica_keywords = ["politics", "political theory", "state", "government", "society"]
+    return _best_work_type(score_work_type(subjects))
 
-    combined_subjects = " ".join(subjects).lower()
+def classify_work_types(records):
+    """
+    Clasifica de una vez muchos registros de Open Library (diccionarios con 'subject').
+    Recorre con la expresión compilada un único texto con todos los géneros y reparte
+    cada coincidencia a su registro. Retorna una lista de (tipo de obra, puntuaciones).
+    """
+    parts = []
+    offsets = []  # Posición inicial de cada registro dentro del texto combinado
+    position = 0
+    for record in records:
+        text = "\n".join(record.get('subject') or [])
+        offsets.append(position)
+        parts.append(text)
+        position += len(text) + 1
+    all_scores = [dict.fromkeys(WORK_TYPES, 0) for _ in offsets]
+    for match in _WORK_TYPE_PATTERN.finditer("\x00".join(parts)):
+        work_type, weight = WORK_TYPE_KEYWORDS[match.group(0).lower()]
+        all_scores[bisect.bisect_right(offsets, match.start()) - 1][work_type] += weight
+    return [(_best_work_type(scores), scores) for scores in all_scores]
 
-    if any(keyword in combined_subjects for keyword in literatura_keywords):
-        return "Literaria"
-    elif any(keyword in combined_subjects for keyword in filosofia_keywords):
-        return "Filosófica"
-    elif any(keyword in combined_subjects for keyword in politica_keywords):
-        return "Política"
-    else:
-        return "Otro"
+if __name__ == "__main__":
+    start = time.perf_counter()
+    found = prefetch_predefined_works()
+    print(f"Caché de Open Library precargado: {found} obras encontradas en {time.perf_counter() - start:.1f} s")
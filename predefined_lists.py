@@ -1,105 +1,57 @@
 # predefined_lists.py
 
-PREDEFINED_WORKS = [
-    "Don Quijote de la Mancha",
-    "La Odisea",
-    "Hamlet",
-    "Matar a un ruiseñor",
-    "Cien años de soledad",
-    "1984",
-    "El Principito",
-    "La Divina Comedia",
-    "Romeo y Julieta",
-    "Fahrenheit 451",
-    "Moby Dick",
-    "Orgullo y Prejuicio",
-    "En busca del tiempo perdido",
-    "Ulises",
-    "El Gran Gatsby",
-    "Crimen y Castigo",
-    "Las Aventuras de Huckleberry Finn",
-    "El Señor de los Anillos",
-    "La metamorfosis",
-    "Anna Karenina",
-    "El retrato de Dorian Gray",
-    "Las mil y una noches",
-    "Guerra y Paz",
-    "El extranjero",
-    "Madame Bovary",
-    "Las uvas de la ira",
-    "El guardián entre el centeno",
-    "La Iliada",
-    "Beloved",
-    "Jane Eyre",
-    "Lolita",
-    "El Proceso",
-    "Los hermanos Karamazov",
-    "El señor de los anillos",
-    "Matar a un ruiseñor",
-    "El viejo y el mar",
-    "La náusea",
-    "Cumbres Borrascosas",
-    "El lobo estepario",
-    "La isla del tesoro",
-    "Rebelión en la granja",
-    "El Perfume",
-    "El nombre de la rosa",
-    "Las ratas",
-    "Los miserables",
-    "El principito",
-    "El código Da Vinci",
-    "El perfume de la dama en negro"
+# Cada obra va emparejada con su autor; las variantes repetidas las unifica catalogue.py
+PREDEFINED_CATALOGUE = [
+    ("Don Quijote de la Mancha", "Miguel de Cervantes"),
+    ("La Odisea", "Homero"),
+    ("Hamlet", "William Shakespeare"),
+    ("Matar a un ruiseñor", "Harper Lee"),
+    ("Cien años de soledad", "Gabriel García Márquez"),
+    ("1984", "George Orwell"),
+    ("El Principito", "Antoine de Saint-Exupéry"),
+    ("La Divina Comedia", "Dante Alighieri"),
+    ("Romeo y Julieta", "William Shakespeare"),
+    ("Fahrenheit 451", "Ray Bradbury"),
+    ("Moby Dick", "Herman Melville"),
+    ("Orgullo y Prejuicio", "Jane Austen"),
+    ("En busca del tiempo perdido", "Marcel Proust"),
+    ("Ulises", "James Joyce"),
+    ("El Gran Gatsby", "F. Scott Fitzgerald"),
+    ("Crimen y Castigo", "Fyodor Dostoevsky"),
+    ("Las Aventuras de Huckleberry Finn", "Mark Twain"),
+    ("El Señor de los Anillos", "J.R.R. Tolkien"),
+    ("La metamorfosis", "Franz Kafka"),
+    ("Anna Karenina", "Leo Tolstoy"),
+    ("El retrato de Dorian Gray", "Oscar Wilde"),
+    ("Las mil y una noches", "Anónimo"),
+    ("Guerra y Paz", "Leo Tolstoy"),
+    ("El extranjero", "Albert Camus"),
+    ("Madame Bovary", "Gustave Flaubert"),
+    ("Las uvas de la ira", "John Steinbeck"),
+    ("El guardián entre el centeno", "J.D. Salinger"),
+    ("La Iliada", "Homero"),
+    ("Beloved", "Toni Morrison"),
+    ("Jane Eyre", "Charlotte Brontë"),
+    ("Lolita", "Vladimir Nabokov"),
+    ("El Proceso", "Franz Kafka"),
+    ("Los hermanos Karamazov", "Fyodor Dostoevsky"),
+    ("El señor de los anillos", "J.R.R. Tolkien"),
+    ("Matar a un ruiseñor", "Harper Lee"),
+    ("El viejo y el mar", "Ernest Hemingway"),
+    ("La náusea", "Jean-Paul Sartre"),
+    ("Cumbres Borrascosas", "Emily Brontë"),
+    ("El lobo estepario", "Hermann Hesse"),
+    ("La isla del tesoro", "Robert Louis Stevenson"),
+    ("Rebelión en la granja", "George Orwell"),
+    ("El Perfume", "Patrick Süskind"),
+    ("El nombre de la rosa", "Umberto Eco"),
+    ("Las ratas", "Miguel Delibes"),
+    ("Los miserables", "Victor Hugo"),
+    ("El principito", "Antoine de Saint-Exupéry"),
+    ("El código Da Vinci", "Dan Brown"),
+    ("El perfume de la dama en negro", "Gaston Leroux")
 ]
 
-PREDEFINED_AUTHORS = [
-    "Miguel de Cervantes",
-    "Homero",
-    "William Shakespeare",
-    "Harper Lee",
-    "Gabriel García Márquez",
-    "George Orwell",
-    "Antoine de Saint-Exupéry",
-    "Dante Alighieri",
-    "William Shakespeare",
-    "Ray Bradbury",
-    "Herman Melville",
-    "Jane Austen",
-    "Marcel Proust",
-    "James Joyce",
-    "F. Scott Fitzgerald",
-    "Fyodor Dostoevsky",
-    "Mark Twain",
-    "J.R.R. Tolkien",
-    "Franz Kafka",
-    "Leo Tolstoy",
-    "Oscar Wilde",
-    "Anónimo",
-    "Fyodor Dostoevsky",
-    "Albert Camus",
-    "Gustave Flaubert",
-    "John Steinbeck",
-    "J.D. Salinger",
-    "Homero",
-    "Toni Morrison",
-    "Charlotte Brontë",
-    "Vladimir Nabokov",
-    "Franz Kafka",
-    "Fyodor Dostoevsky",
-    "Harper Lee",
-    "Ernest Hemingway",
-    "Jean-Paul Sartre",
-    "Emily Brontë",
-    "Hermann Hesse",
-    "Robert Louis Stevenson",
-    "George Orwell",
-    "Patrick Süskind",
-    "Umberto Eco",
-    "Herman Melville",
-    "Harper Lee",
-    "Antoine de Saint-Exupéry",
-    "Agatha Christie",
-    "Gustave Flaubert",
-    "Anónimo",
-    "Dan Brown",
-    "Patrick Süskind"
-]
+PREDEFINED_WORKS = [work for work, _ in PREDEFINED_CATALOGUE]
+
+PREDEFINED_AUTHORS = [author for _, author in PREDEFINED_CATALOGUE]
@@ -0,0 +1,151 @@
+# rate_limiter.py
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+REQUESTS_PER_MINUTE = 60  # Cuota de peticiones del proveedor para todo el proceso
+TOKENS_PER_MINUTE = 200000  # Cuota de tokens (entrada + salida) para todo el proceso
+
+PRIORITY_INTERACTIVE = 0  # Regeneración o generación de una sola sección pedida por el usuario
+PRIORITY_BULK = 1  # Generación por lotes
+
+_cond = threading.Condition()
+_queues = {PRIORITY_INTERACTIVE: OrderedDict(), PRIORITY_BULK: OrderedDict()}
+_context = threading.local()
+
+class _TokenBucket:
+    """
+    Cubeta de tokens que se rellena de forma continua hasta su capacidad por minuto.
+    """
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing * 60.0 / self.capacity)
+
+    def consume(self, amount):
+        self.tokens -= amount
+
+    def refund(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+_request_bucket = _TokenBucket(REQUESTS_PER_MINUTE)
+_token_bucket = _TokenBucket(TOKENS_PER_MINUTE)
+
+def configure(requests_per_minute=None, tokens_per_minute=None):
+    """
+    Cambia las cuotas del proceso (por ejemplo, para repartir la cuota del proveedor
+    entre varios procesos). Las cubetas se reinician llenas con la nueva capacidad.
+    """
+    global REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, _request_bucket, _token_bucket
+    with _cond:
+        if requests_per_minute:
+            REQUESTS_PER_MINUTE = requests_per_minute
+            _request_bucket = _TokenBucket(requests_per_minute)
+        if tokens_per_minute:
+            TOKENS_PER_MINUTE = tokens_per_minute
+            _token_bucket = _TokenBucket(tokens_per_minute)
+        _cond.notify_all()
+
+def current_session_id():
+    """
+    Retorna el identificador de la sesión de Streamlit activa en este hilo, o None fuera de un script.
+    """
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+@contextmanager
+def lane(session_id, priority):
+    """
+    Asigna la sesión y la prioridad a las llamadas hechas desde este hilo
+    (útil en los hilos de trabajo, que no tienen contexto de Streamlit).
+    """
+    previous = (getattr(_context, "session_id", None), getattr(_context, "priority", None))
+    _context.session_id, _context.priority = session_id, priority
+    try:
+        yield
+    finally:
+        _context.session_id, _context.priority = previous
+
+def current_lane():
+    """
+    Retorna (sesión, prioridad) de las llamadas de este hilo, para reproducirlas con lane()
+    en otro hilo que trabaje en su nombre.
+    """
+    return (getattr(_context, "session_id", None) or current_session_id(), getattr(_context, "priority", None))
+
+def _next_ticket():
+    # La cola interactiva tiene preferencia; dentro de cada cola se alterna entre sesiones
+    for priority in sorted(_queues):
+        for tickets in _queues[priority].values():
+            if tickets:
+                return tickets[0]
+    return None
+
+def acquire(estimated_tokens):
+    """
+    Bloquea hasta que haya cuota para una petición de estimated_tokens tokens, respetando
+    la prioridad y el turno de cada sesión. Retorna los tokens reservados, que deben
+    ajustarse después con reconcile().
+    """
+    session_id = getattr(_context, "session_id", None) or current_session_id() or "default"
+    priority = getattr(_context, "priority", None)
+    if priority is None:
+        priority = PRIORITY_INTERACTIVE
+    reserved = min(estimated_tokens, TOKENS_PER_MINUTE)
+    ticket = object()
+    with _cond:
+        _queues[priority].setdefault(session_id, deque()).append(ticket)
+        while True:
+            if _next_ticket() is ticket:
+                now = time.monotonic()
+                wait = max(_request_bucket.wait_time(1, now), _token_bucket.wait_time(reserved, now))
+                if wait <= 0:
+                    _request_bucket.consume(1)
+                    _token_bucket.consume(reserved)
+                    tickets = _queues[priority][session_id]
+                    tickets.popleft()
+                    # La sesión atendida pasa al final de su cola para que las demás tengan turno
+                    if tickets:
+                        _queues[priority].move_to_end(session_id)
+                    else:
+                        del _queues[priority][session_id]
+                    _cond.notify_all()
+                    return reserved
+                _cond.wait(timeout=wait)
+            else:
+                _cond.wait()
+
+def reconcile(reserved, actual_tokens):
+    """
+    Ajusta la cubeta de tokens con el consumo real informado por el proveedor.
+    Si actual_tokens es None (respuesta sin 'usage'), se mantiene la estimación.
+    """
+    if actual_tokens is None:
+        return
+    with _cond:
+        if actual_tokens < reserved:
+            _token_bucket.refund(reserved - actual_tokens)
+        else:
+            _token_bucket.consume(actual_tokens - reserved)
+        _cond.notify_all()
+
+def estimate_tokens(messages, max_completion_tokens):
+    """
+    Estimación aproximada (4 caracteres por token) del consumo de una petición.
+    """
+    return sum(len(message["content"]) for message in messages) // 4 + max_completion_tokens
@@ -0,0 +1,138 @@
+# references.py
+
+import functools
+import re
+from collections import OrderedDict
+
+from catalogue import normalize_text
+
+TITLE_FINGERPRINT_WORDS = 6  # Palabras del título que forman parte de la clave de una cita
+PARSE_CACHE_SIZE = 8192  # Citas analizadas que se recuerdan en todo el proceso
+
+_DOI = re.compile(r"\b(10\.\d{4,9}/[^\s\"<>]+)", re.IGNORECASE)
+_LIST_MARKER = re.compile(r"^\s*(?:[-*+•]\s+|\d+[.)]\s+|\[\d+\]\s*)")
+_YEAR = re.compile(r"\((\d{4})[a-z]?(?:,[^)]*)?\)|\((s\.\s?f\.|n\.\s?d\.)\)", re.IGNORECASE)
+_REFERENCES_HEADING = re.compile(
+    r"^\s*(?:#{1,6}\s*)?[*_]*\s*(?:referencias(?: bibliográficas)?|bibliografía|references)\s*[*_]*\s*:?\s*[*_]*\s*$",
+    re.IGNORECASE | re.MULTILINE
+)
+_HEADING = re.compile(r"^\s*#{1,6}\s")
+
+class Citation:
+    """
+    Cita bibliográfica analizada: texto limpio, clave normalizada y los campos de los que sale.
+    """
+    __slots__ = ("text", "key", "doi", "author", "year", "title")
+
+    def __init__(self, text, key, doi=None, author="", year="", title=""):
+        self.text = text
+        self.key = key
+        self.doi = doi
+        self.author = author
+        self.year = year
+        self.title = title
+
+def clean_citation(text):
+    """
+    Quita viñetas o numeración al inicio y normaliza los espacios de una cita.
+    """
+    return " ".join(_LIST_MARKER.sub("", text or "").split())
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_citation(text):
+    """
+    Analiza una cita en formato APA. La clave es el DOI si lo tiene; si no, el primer apellido,
+    el año y las primeras palabras del título, sin acentos, mayúsculas ni puntuación.
+    Las citas repetidas entre estudios se analizan una sola vez.
+    """
+    text = clean_citation(text)
+    doi_match = _DOI.search(text)
+    if doi_match:
+        doi = doi_match.group(1).rstrip(".,;").lower()
+    else:
+        doi = None
+    year_match = _YEAR.search(text)
+    if year_match:
+        year = (year_match.group(1) or "sf").lower()
+        author = normalize_text(text[:year_match.start()].split(",")[0])
+        title_words = normalize_text(text[year_match.end():].lstrip(". ")).split()[:TITLE_FINGERPRINT_WORDS]
+        title = " ".join(title_words)
+    else:
+        year, author, title = "", "", ""
+    if doi:
+        key = f"doi:{doi}"
+    elif year_match and (author or title):
+        key = f"{author}|{year}|{title}"
+    else:
+        key = normalize_text(text)
+    return Citation(text, key, doi, author, year, title)
+
+def _looks_like_citation(line):
+    return bool(_YEAR.search(line) or _DOI.search(line) or "http" in line)
+
+def extract_references(section_content):
+    """
+    Extrae las citas del apartado "Referencias" (o "Bibliografía") al final de la sección.
+    Solo se toman las líneas con aspecto de cita (año entre paréntesis, DOI o URL) y la lectura
+    se detiene en el siguiente encabezado.
+    """
+    headings = list(_REFERENCES_HEADING.finditer(section_content or ""))
+    if not headings:
+        return []
+    references = []
+    for line in section_content[headings[-1].end():].split("\n"):
+        if _HEADING.match(line):
+            break
+        line = clean_citation(line)
+        if line and _looks_like_citation(line):
+            references.append(line)
+    return references
+
+def strip_references(section_content):
+    """
+    Retorna el texto de la sección sin el apartado final de referencias (si lo tiene).
+    """
+    headings = list(_REFERENCES_HEADING.finditer(section_content or ""))
+    if not headings:
+        return (section_content or "").strip()
+    return section_content[:headings[-1].start()].strip()
+
+class ReferenceStore:
+    """
+    Referencias de un estudio sin duplicados, en orden de aparición. Dos citas son la misma
+    si comparten la clave normalizada de parse_citation; al repetirse se conserva la versión
+    más completa (con DOI o más larga).
+    """
+
+    def __init__(self, references=()):
+        self._entries = OrderedDict()  # Clave -> Citation
+        self.add(references)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return (citation.text for citation in self._entries.values())
+
+    def __contains__(self, reference):
+        return parse_citation(reference).key in self._entries
+
+    def add(self, references):
+        """
+        Añade las citas nuevas y completa las existentes. Retorna las claves añadidas.
+        """
+        added = []
+        for reference in references:
+            if not clean_citation(reference):
+                continue
+            citation = parse_citation(reference)
+            current = self._entries.get(citation.key)
+            if current is None:
+                self._entries[citation.key] = citation
+                added.append(citation.key)
+            elif (citation.doi and not current.doi) or (bool(citation.doi) == bool(current.doi) and len(citation.text) > len(current.text)):
+                self._entries[citation.key] = citation
+        return added
+
+    def texts(self):
+        return [citation.text for citation in self._entries.values()]
@@ -0,0 +1,126 @@
+# study_document.py
+
+import content_store
+from references import ReferenceStore
+
+class StudyDocument:
+    """
+    Estructura de un estudio: encabezado (título y descripción), lista ordenada de secciones
+    (que también forma la tabla de contenidos) y tabla de referencias. El texto de cada sección
+    se guarda una sola vez en content_store y el documento solo conserva su identificador, de
+    modo que las sesiones ocupan poca memoria; el Markdown se genera bajo demanda.
+    """
+
+    def __init__(self, title="", description="", table_of_contents=None):
+        self.title = title
+        self.description = description
+        self.sections = []  # Lista de diccionarios: [{'number': 1, 'title': 'Título', 'content_id': '...', 'references': []}, ...]
+        self.reference_store = ReferenceStore()  # Referencias académicas de todo el estudio, sin duplicados
+        self._index = {}  # Número de sección -> posición en self.sections
+        if table_of_contents:
+            self.set_table_of_contents(table_of_contents)
+
+    def set_header(self, title, description):
+        self.title = title
+        self.description = description
+
+    def set_table_of_contents(self, table_of_contents):
+        """
+        Inicializa las secciones a partir de la tabla de contenidos; las entradas pueden traer
+        ya su texto ('content') o su identificador en content_store ('content_id').
+        """
+        content_ids = content_store.put_many([sec.get('content') or "" for sec in table_of_contents])
+        self.sections = [
+            {
+                "number": sec['number'],
+                "title": sec['title'],
+                "content_id": content_key or sec.get('content_id'),
+                "references": list(sec.get('references', []))
+            }
+            for sec, content_key in zip(table_of_contents, content_ids)
+        ]
+        self._index = {sec['number']: idx for idx, sec in enumerate(self.sections)}
+
+    def get_section(self, number):
+        return self.sections[self._index[number]]
+
+    def section_content(self, number):
+        """
+        Texto de una sección ("" si aún no se ha generado), leído de content_store.
+        """
+        return content_store.get(self.get_section(number)['content_id'])
+
+    def update_section(self, number, title=None, content=None, references=None, content_id=None):
+        """
+        Actualiza una sección. El texto se puede dar directamente (content) o como un
+        identificador ya guardado en content_store (content_id).
+        Las referencias nuevas se añaden a la tabla global de referencias.
+        """
+        section = self.get_section(number)
+        if title is not None:
+            section['title'] = title
+        if content is not None:
+            content_id = content_store.put(content)
+        if content_id is not None:
+            section['content_id'] = content_id
+        if references is not None:
+            section['references'] = list(references)
+            self.add_references(references)
+
+    @property
+    def references(self):
+        return self.reference_store.texts()
+
+    def add_references(self, references):
+        self.reference_store.add(references)
+
+    def generated_sections(self):
+        return [sec for sec in self.sections if sec['content_id']]
+
+    def pending_sections(self):
+        return [sec for sec in self.sections if not sec['content_id']]
+
+    def is_complete(self):
+        return bool(self.sections) and not self.pending_sections()
+
+    def render_header(self, sections=None):
+        """
+        Markdown del título, la descripción y la tabla de contenidos.
+        """
+        sections = self.sections if sections is None else sections
+        header = f"# {self.title}\n\n{self.description}\n\n## Tabla de Contenidos\n\n"
+        header += "".join(f"{sec['number']}. {sec['title']}\n" for sec in sections)
+        return header + "\n"
+
+    def render_section(self, number):
+        """
+        Markdown de una sección. No se guarda en el documento: el texto ya está en la caché
+        compartida de content_store y el Markdown solo le agrega el encabezado.
+        """
+        sec = self.get_section(number)
+        return f"## Sección {sec['number']}: {sec['title']}\n\n{self.section_content(number)}\n\n"
+
+    def render_references(self):
+        if not self.reference_store:
+            return ""
+        return "## Referencias\n\n" + "".join(f"{ref}\n" for ref in self.reference_store)
+
+    def to_markdown(self, partial=False, include_references=True):
+        """
+        Genera el Markdown del estudio. Con partial=True la tabla de contenidos solo lista las
+        secciones generadas y el cuerpo se detiene en la primera sección pendiente.
+        """
+        if partial:
+            body_sections = []
+            for sec in self.sections:
+                if not sec['content_id']:
+                    break  # Solo incluir secciones generadas hasta el momento
+                body_sections.append(sec)
+            parts = [self.render_header(self.generated_sections())]
+        else:
+            body_sections = self.generated_sections()
+            parts = [self.render_header()]
+        parts.extend(self.render_section(sec['number']) for sec in body_sections)
+        if include_references:
+            parts.append(self.render_references())
+        return "".join(parts)
@@ -0,0 +1,231 @@
+# study_store.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import content_store
+from study_document import StudyDocument
+
+STORE_PATH = os.environ.get("OBRASCLASICAS_STUDY_STORE_PATH", os.path.join(".cache", "studies.sqlite3"))
+ORPHAN_COLLECTION_INTERVAL_SECONDS = 60 * 60  # Como mucho una limpieza de textos huérfanos por hora y proceso
+
+_SECTIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS sections (
+        study_id TEXT NOT NULL,
+        number INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        content_id TEXT,
+        refs TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (study_id, number)
+    )
+"""
+
+_initialized_paths = set()
+_collection_lock = threading.Lock()
+_last_collection = 0.0
+
+def new_study_id():
+    return uuid.uuid4().hex[:12]
+
+def _connect(path=None):
+    """
+    Abre una conexión al almacén de estudios, creando las tablas si no existen.
+    """
+    path = path or STORE_PATH
+    if path not in _initialized_paths:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
+    if path not in _initialized_paths:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS studies (
+                id TEXT PRIMARY KEY,
+                work_title TEXT NOT NULL,
+                author TEXT NOT NULL,
+                work_type TEXT NOT NULL,
+                title TEXT NOT NULL,
+                description TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute(_SECTIONS_TABLE)
+        if "content" in {row[1] for row in conn.execute("PRAGMA table_info(sections)")}:
+            _migrate_section_contents(conn)
+        conn.execute("CREATE INDEX IF NOT EXISTS sections_content_id ON sections (content_id)")
+        conn.commit()
+        _initialized_paths.add(path)
+    return conn
+
+def _migrate_section_contents(conn):
+    """
+    Los almacenes anteriores guardaban el texto de cada sección en la tabla: se pasa a
+    content_store y la tabla conserva solo su identificador.
+    """
+    rows = conn.execute("SELECT study_id, number, title, content, refs, updated_at FROM sections").fetchall()
+    content_ids = content_store.put_many([row[3] for row in rows])
+    with conn:
+        conn.execute("DROP TABLE sections")
+        conn.execute(_SECTIONS_TABLE)
+        conn.executemany(
+            "INSERT INTO sections (study_id, number, title, content_id, refs, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(study_id, number, title, key, refs, updated_at) for (study_id, number, title, _, refs, updated_at), key in zip(rows, content_ids)]
+        )
+
+def _section_row(study_id, section, now):
+    return (study_id, section['number'], section['title'], section['content_id'], json.dumps(section['references'], ensure_ascii=False), now)
+
+def _release_contents(content_ids, path=None):
+    """
+    Marca como huérfanos en content_store los textos que una sección dejó de usar (al
+    regenerarse o al borrarse). No se borran en el momento: el mismo texto puede estar en
+    otro estudio o en el documento de otra sesión abierta; de eso se encarga
+    collect_unreferenced_contents, en segundo plano y pasado el periodo de gracia.
+    """
+    content_ids = [key for key in content_ids if key]
+    if content_ids:
+        content_store.mark_orphans(content_ids)
+        _schedule_collection(path)
+
+def _schedule_collection(path=None):
+    global _last_collection
+    with _collection_lock:
+        if time.time() - _last_collection < ORPHAN_COLLECTION_INTERVAL_SECONDS:
+            return
+        _last_collection = time.time()
+    threading.Thread(target=collect_unreferenced_contents, kwargs={"path": path}, daemon=True).start()
+
+def collect_unreferenced_contents(grace_seconds=None, path=None):
+    """
+    Borra de content_store los textos marcados como huérfanos hace más de grace_seconds
+    (por defecto content_store.ORPHAN_GRACE_SECONDS) que ninguna sección guardada usa.
+    Retorna el número de textos borrados.
+    """
+    grace_seconds = content_store.ORPHAN_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    older_than = time.time() - grace_seconds
+    candidates = content_store.orphans(older_than)
+    if not candidates:
+        return 0
+    referenced = set()
+    conn = _connect(path)
+    try:
+        for start in range(0, len(candidates), 500):  # Por lotes, por el límite de parámetros de SQLite
+            batch = candidates[start:start + 500]
+            referenced.update(row[0] for row in conn.execute(
+                f"SELECT DISTINCT content_id FROM sections WHERE content_id IN ({', '.join('?' * len(batch))})", batch
+            ))
+    finally:
+        conn.close()
+    return content_store.collect_orphans(candidates, older_than, keep=referenced)
+
+def save_study(study_id, document, work_title, author="", work_type="", path=None):
+    """
+    Guarda el encabezado y la lista de secciones de un estudio. Se usa al crear el estudio y
+    al editar su información inicial. El texto de las secciones no se lee ni se copia: solo se
+    guarda el identificador de content_store de las que aún no tenían uno, porque el contenido
+    lo escribe save_section y el documento de la sesión pudo quedar desactualizado (o aún no
+    incorporar lo que terminó un trabajo en segundo plano).
+    """
+    now = time.time()
+    conn = _connect(path)
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO studies (id, work_title, author, work_type, title, description, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET work_title = excluded.work_title, author = excluded.author,
+                    work_type = excluded.work_type, title = excluded.title, description = excluded.description,
+                    updated_at = excluded.updated_at
+            """, (study_id, work_title, author or "", work_type or "", document.title, document.description, now, now))
+            numbers = [section['number'] for section in document.sections]
+            removed = [row[0] for row in conn.execute(
+                f"SELECT content_id FROM sections WHERE study_id = ? AND number NOT IN ({', '.join('?' * len(numbers))})",
+                (study_id, *numbers)
+            )]
+            conn.execute(
+                f"DELETE FROM sections WHERE study_id = ? AND number NOT IN ({', '.join('?' * len(numbers))})",
+                (study_id, *numbers)
+            )
+            conn.executemany("""
+                INSERT INTO sections (study_id, number, title, content_id, refs, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(study_id, number) DO UPDATE SET
+                    title = CASE WHEN excluded.content_id IS NULL AND sections.content_id IS NOT NULL THEN sections.title ELSE excluded.title END,
+                    content_id = COALESCE(sections.content_id, excluded.content_id),
+                    refs = CASE WHEN sections.content_id IS NULL THEN excluded.refs ELSE sections.refs END,
+                    updated_at = excluded.updated_at
+            """, [_section_row(study_id, section, now) for section in document.sections])
+    finally:
+        conn.close()
+    _release_contents(removed, path)
+
+def save_section(study_id, section, path=None):
+    """
+    Guarda una sola sección (se llama cada vez que una sección termina de generarse). section
+    trae el identificador de su texto en content_store ('content_id'); el texto que reemplaza
+    se marca como huérfano (véase _release_contents).
+    """
+    now = time.time()
+    conn = _connect(path)
+    try:
+        with conn:
+            previous = conn.execute(
+                "SELECT content_id FROM sections WHERE study_id = ? AND number = ?", (study_id, section['number'])
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO sections (study_id, number, title, content_id, refs, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                _section_row(study_id, section, now)
+            )
+            conn.execute("UPDATE studies SET updated_at = ? WHERE id = ?", (now, study_id))
+    finally:
+        conn.close()
+    if previous is not None and previous[0] != section['content_id']:
+        _release_contents([previous[0]], path)
+
+def load_study(study_id, path=None):
+    """
+    Reconstruye un estudio guardado. Retorna (documento, metadatos) o (None, None) si no existe;
+    los metadatos incluyen 'work_title', 'author' y 'work_type'.
+    """
+    conn = _connect(path)
+    try:
+        study = conn.execute(
+            "SELECT work_title, author, work_type, title, description FROM studies WHERE id = ?", (study_id,)
+        ).fetchone()
+        if study is None:
+            return None, None
+        rows = conn.execute(
+            "SELECT number, title, content_id, refs FROM sections WHERE study_id = ? ORDER BY number", (study_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    work_title, author, work_type, title, description = study
+    # El documento solo recibe los identificadores: los textos se leen de content_store al mostrarlos
+    document = StudyDocument(title, description, [
+        {"number": number, "title": sec_title, "content_id": content_key, "references": json.loads(refs)}
+        for number, sec_title, content_key, refs in rows
+    ])
+    # Reconstruir la tabla global de referencias en el orden de las secciones
+    for section in document.sections:
+        document.add_references(section['references'])
+    return document, {"work_title": work_title, "author": author, "work_type": work_type}
+
+def delete_study(study_id, path=None):
+    """
+    Borra un estudio; los textos de sus secciones se marcan como huérfanos en content_store.
+    """
+    conn = _connect(path)
+    try:
+        with conn:
+            removed = [row[0] for row in conn.execute("SELECT content_id FROM sections WHERE study_id = ?", (study_id,))]
+            conn.execute("DELETE FROM sections WHERE study_id = ?", (study_id,))
+            conn.execute("DELETE FROM studies WHERE id = ?", (study_id,))
+    finally:
+        conn.close()
+    _release_contents(removed, path)
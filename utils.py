@@ -1,44 +1,274 @@
 # utils.py
 
-import markdown
-from bs4 import BeautifulSoup
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+
 from docx import Document
+from docx.oxml import parse_xml
 from io import BytesIO
+from markdown_it import MarkdownIt
+
+EXPORT_CACHE_MAX_ENTRIES = 16  # Documentos .docx que se conservan en memoria
+CODE_FONT = "Courier New"
+
+_export_cache = OrderedDict()
+_export_lock = threading.Lock()
+_markdown_parser = MarkdownIt("commonmark").enable(["table", "strikethrough"])
+_W_NAMESPACE = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def _run_xml(text, bold=False, italic=False, strike=False, code=False, font_size=None, line_break=False):
+    """
+    XML de un run (w:r). Las propiedades siguen el orden que exige el esquema de WordprocessingML.
+    """
+    props = ""
+    if code:
+        props += f'<w:rFonts w:ascii="{CODE_FONT}" w:hAnsi="{CODE_FONT}" w:cs="{CODE_FONT}"/>'
+    if bold:
+        props += "<w:b/>"
+    if italic:
+        props += "<w:i/>"
+    if strike:
+        props += "<w:strike/>"
+    if font_size:
+        props += f'<w:sz w:val="{font_size * 2}"/>'
+    run = "<w:r>"
+    if props:
+        run += f"<w:rPr>{props}</w:rPr>"
+    if text:
+        run += f'<w:t xml:space="preserve">{escape(_INVALID_XML_CHARS.sub("", text))}</w:t>'
+    if line_break:
+        run += "<w:br/>"
+    return run + "</w:r>"
+
+def _inline_runs_xml(inline_token):
+    """
+    XML de los runs de un token 'inline', conservando negrita, cursiva, tachado, código
+    y saltos de línea. Los fragmentos contiguos con el mismo formato se unen en un único run.
+    """
+    bold = italic = strike = 0
+    runs = []
+    pending = []  # Texto acumulado con el formato pending_format
+    pending_format = ()
+    for child in inline_token.children or []:
+        kind = child.type
+        if kind == "strong_open":
+            bold += 1
+        elif kind == "strong_close":
+            bold -= 1
+        elif kind == "em_open":
+            italic += 1
+        elif kind == "em_close":
+            italic -= 1
+        elif kind == "s_open":
+            strike += 1
+        elif kind == "s_close":
+            strike -= 1
+        elif kind in ("text", "softbreak", "code_inline", "html_inline", "image"):
+            if kind == "softbreak":
+                text = " "
+            elif kind == "image":
+                text = child.content or child.attrs.get("alt", "")
+            else:
+                text = child.content
+            if not text:
+                continue
+            run_format = (bold > 0, italic > 0, strike > 0, kind == "code_inline")
+            if run_format != pending_format and pending:
+                runs.append(_run_xml("".join(pending), *pending_format))
+                pending = []
+            pending_format = run_format
+            pending.append(text)
+        elif kind == "hardbreak":
+            runs.append(_run_xml("".join(pending), *pending_format, line_break=True))
+            pending = []
+    if pending:
+        runs.append(_run_xml("".join(pending), *pending_format))
+    return "".join(runs)
+
+class _DocxWriter:
+    """
+    Agrega bloques al final del cuerpo de un documento de python-docx construyendo su XML
+    directamente. Evita la búsqueda de estilos por nombre y la inserción elemento a elemento
+    de add_paragraph/add_run, que dominan el tiempo en documentos grandes.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._sect_pr = doc.element.body.sectPr
+        self._style_ids = {}
+        self._abstract_num_ids = {}
+
+    def _style_id(self, style_name):
+        if style_name not in self._style_ids:
+            self._style_ids[style_name] = self.doc.styles[style_name].style_id
+        return self._style_ids[style_name]
+
+    def numbering(self, style_name, start=1):
+        """
+        Crea una numeración (w:num) que empieza en start con la definición del estilo de lista
+        indicado. Todos los párrafos con el estilo comparten su numId, de modo que sin una
+        numeración propia cada lista continuaría la cuenta de la anterior. Retorna el numId.
+        """
+        numbering = self.doc.part.numbering_part.element
+        if style_name not in self._abstract_num_ids:
+            style_num_id = self.doc.styles[style_name].element.pPr.numPr.numId.val
+            self._abstract_num_ids[style_name] = numbering.num_having_numId(style_num_id).abstractNumId.val
+        num = numbering.add_num(self._abstract_num_ids[style_name])
+        num.add_lvlOverride(ilvl=0).add_startOverride(start)
+        return num.numId
+
+    def paragraph(self, runs_xml, style_name=None, num_id=None):
+        ppr = ""
+        if style_name:
+            ppr += f'<w:pStyle w:val="{self._style_id(style_name)}"/>'
+        if num_id is not None:
+            ppr += f'<w:numPr><w:ilvl w:val="0"/><w:numId w:val="{num_id}"/></w:numPr>'
+        if ppr:
+            ppr = f"<w:pPr>{ppr}</w:pPr>"
+        element = parse_xml(f"<w:p {_W_NAMESPACE}>{ppr}{runs_xml}</w:p>")
+        # Las propiedades de sección deben seguir siendo el último hijo del cuerpo
+        if self._sect_pr is not None:
+            self._sect_pr.addprevious(element)
+        else:
+            self.doc.element.body.append(element)
+
+    def heading(self, runs_xml, level):
+        self.paragraph(runs_xml, "Title" if level == 0 else f"Heading {level}")
+
+    def table(self, rows):
+        columns = max((len(row) for row in rows), default=0)
+        if not columns:
+            return
+        table = self.doc.add_table(rows=len(rows), cols=columns)
+        table.style = "Table Grid"
+        for row_idx, row in enumerate(rows):
+            for col_idx, cell_inline in enumerate(row):
+                cell_p = table.cell(row_idx, col_idx).paragraphs[0]._p
+                for run in parse_xml(f"<w:p {_W_NAMESPACE}>{_inline_runs_xml(cell_inline)}</w:p>"):
+                    cell_p.append(run)
+
+def _list_style(list_stack):
+    """
+    Estilo de párrafo para el elemento de lista actual según su tipo y profundidad.
+    """
+    base = "List Bullet" if list_stack[-1] == "bullet" else "List Number"
+    depth = min(len(list_stack), 3)
+    return base if depth == 1 else f"{base} {depth}"
+
+def render_markdown_to_docx(markdown_content, doc):
+    """
+    Recorre en una sola pasada los tokens de Markdown y escribe directamente en el documento
+    de python-docx: encabezados, párrafos con formato, listas, citas, bloques de código y tablas.
+    Retorna el escritor para que se puedan agregar más bloques al final.
+    """
+    writer = _DocxWriter(doc)
+    list_stack = []  # "bullet" u "ordered" por cada lista abierta
+    list_num_ids = []  # Por cada lista: numId de su numeración propia (None en las de viñetas)
+    item_started = []  # Por cada lista: si el elemento actual ya tiene su primer párrafo
+    quote_depth = 0
+    table_rows = None  # Filas de la tabla en construcción (listas de tokens inline)
+    heading_level = None
+    for token in _markdown_parser.parse(markdown_content):
+        kind = token.type
+        if kind == "heading_open":
+            heading_level = min(int(token.tag[1]), 9)
+        elif kind == "heading_close":
+            heading_level = None
+        elif kind in ("bullet_list_open", "ordered_list_open"):
+            list_stack.append("bullet" if kind == "bullet_list_open" else "ordered")
+            item_started.append(False)
+            # Cada lista numerada empieza su propia cuenta (en 1 o en el número del primer elemento)
+            list_num_ids.append(writer.numbering(_list_style(list_stack), int(token.attrs.get("start", 1))) if kind == "ordered_list_open" else None)
+        elif kind in ("bullet_list_close", "ordered_list_close"):
+            list_stack.pop()
+            item_started.pop()
+            list_num_ids.pop()
+        elif kind == "list_item_open":
+            item_started[-1] = False
+        elif kind == "blockquote_open":
+            quote_depth += 1
+        elif kind == "blockquote_close":
+            quote_depth -= 1
+        elif kind == "table_open":
+            table_rows = []
+        elif kind == "tr_open":
+            table_rows.append([])
+        elif kind == "table_close":
+            writer.table(table_rows)
+            table_rows = None
+        elif kind == "inline":
+            if table_rows is not None:
+                table_rows[-1].append(token)
+            elif heading_level is not None:
+                writer.heading(_inline_runs_xml(token), heading_level)
+            else:
+                num_id = None
+                if list_stack:
+                    if item_started[-1]:
+                        depth = min(len(list_stack), 3)
+                        style = "List Continue" if depth == 1 else f"List Continue {depth}"
+                    else:
+                        style = _list_style(list_stack)
+                        num_id = list_num_ids[-1]
+                        item_started[-1] = True
+                elif quote_depth:
+                    style = "Quote"
+                else:
+                    style = None
+                writer.paragraph(_inline_runs_xml(token), style, num_id)
+        elif kind in ("fence", "code_block"):
+            # Un salto de línea dentro de w:t se muestra como espacio: cada línea termina con w:br
+            lines = token.content.rstrip("\n").split("\n")
+            writer.paragraph("".join(
+                _run_xml(line, code=True, font_size=9, line_break=idx < len(lines) - 1) for idx, line in enumerate(lines)
+            ))
+        elif kind == "html_block" and token.content.strip():
+            writer.paragraph(_run_xml(token.content.strip()))
+    return writer
 
 def export_to_word(markdown_content, references):
     """
     Convierte el contenido Markdown a un documento de Word, incluyendo las referencias.
     """
-    # Convertir Markdown a HTML
-    html = markdown.markdown(markdown_content)
-    
-    # Parsear HTML con BeautifulSoup
-    soup = BeautifulSoup(html, 'html.parser')
-    
-    # Crear un documento de Word
+    # Crear un documento de Word y escribir el contenido directamente desde los tokens de Markdown
     doc = Document()
-    
-    # Iterar sobre los elementos del HTML y agregarlos al documento
-    for element in soup.descendants:
-        if isinstance(element, str):
-            continue  # Ignorar cadenas de texto directas
-        if element.name == 'h1':
-            doc.add_heading(element.get_text(), level=1)
-        elif element.name == 'h2':
-            doc.add_heading(element.get_text(), level=2)
-        elif element.name == 'h3':
-            doc.add_heading(element.get_text(), level=3)
-        elif element.name == 'p':
-            doc.add_paragraph(element.get_text())
-    
+    writer = render_markdown_to_docx(markdown_content, doc)
+
     # Agregar sección de Referencias si existen
     if references:
-        doc.add_heading("Referencias", level=2)
+        writer.heading(_run_xml("Referencias"), 2)
+        num_id = writer.numbering('List Number')
         for ref in references:
-            doc.add_paragraph(ref, style='List Number')
-    
+            writer.paragraph(_run_xml(ref), 'List Number', num_id)
+
     # Guardar el documento en un objeto BytesIO
     buffer = BytesIO()
     doc.save(buffer)
     buffer.seek(0)
     return buffer
+
+def export_to_word_cached(markdown_content, references):
+    """
+    Igual que export_to_word, pero retorna los bytes del .docx y los memoriza según un hash
+    del contenido y las referencias, descartando los menos usados recientemente.
+    """
+    digest = hashlib.sha256()
+    digest.update(markdown_content.encode("utf-8"))
+    for ref in references:
+        digest.update(b"\x00" + ref.encode("utf-8"))
+    key = digest.hexdigest()
+    with _export_lock:
+        if key in _export_cache:
+            _export_cache.move_to_end(key)
+            return _export_cache[key]
+    data = export_to_word(markdown_content, references).getvalue()
+    with _export_lock:
+        _export_cache[key] = data
+        _export_cache.move_to_end(key)
+        while len(_export_cache) > EXPORT_CACHE_MAX_ENTRIES:
+            _export_cache.popitem(last=False)
+    return data